@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeChain:
+    # Имитация LLM: только задержка, без сети
+    def __init__(self, latency):
+        self.latency = latency
+        self.combine_documents_chain = self
+
+    async def ainvoke(self, inputs):
+        await asyncio.sleep(self.latency)
+        return {"output_text": f"ответ на: {inputs['question']}"}
+
+
+class FakeStore:
+    def similarity_search_by_vector(self, vector, k=5):
+        return []
+
+
+def use_fakes(faq, latency):
+    from modes.embeddings import EmbeddingProvider
+
+    class FakeEmbeddings(EmbeddingProvider):
+        key = 'fake'
+
+        def _embed(self, texts, kind):
+            return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+        async def _aembed(self, texts, kind):
+            await asyncio.sleep(latency / 10)
+            return self._embed(texts, kind)
+
+    faq.embeddings = FakeEmbeddings()
+    faq.vectorstore, faq.qa_chain, faq.faq_version = FakeStore(), FakeChain(latency), 'load-test'
+
+
+def read_questions(csv_path, limit):
+    from modes.faq_index import read_rows
+
+    return [question for question, _ in read_rows(csv_path).values()][:limit]
+
+
+async def run_level(faq, questions, users):
+    # users одновременных пользователей, каждый задаёт свою часть вопросов по очереди
+    latencies, errors = [], 0
+
+    async def user(batch):
+        nonlocal errors
+        for question in batch:
+            started = time.perf_counter()
+            try:
+                await faq.answer_question(question)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                print(f"  ошибка: {type(e).__name__} {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(questions[i::users]) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"пользователей {users:3d}: {len(latencies) / elapsed:7.2f} ответов/с, "
+          f"p50 {latencies[len(latencies) // 2] if latencies else 0.0:.2f} c, p95 {p95:.2f} c, ошибок {errors}")
+
+
+async def main(args):
+    if args.fake_latency:
+        os.environ.setdefault('OPENAI_API_KEY', 'load-test')
+    from modes import faq
+    from modes.faq_cache import AnswerCache
+
+    if args.fake_latency:
+        use_fakes(faq, args.fake_latency)
+    else:
+        await faq.reload_faq_data()
+    if not args.cache:
+        faq.answer_cache = AnswerCache(None, threshold=2.0)
+
+    questions = read_questions(args.csv, args.questions)
+    print(f"{len(questions)} вопросов, FAQ_CONCURRENCY={os.getenv('FAQ_CONCURRENCY', 8)}")
+    for users in args.users:
+        await run_level(faq, questions, users)
+
+
+if __name__ == '__main__':
+    cli = argparse.ArgumentParser(description="Нагрузочный тест режима FAQ: пропускная способность "
+                                              "при разном числе одновременных пользователей")
+    cli.add_argument('--csv', default=os.getenv('FAQ_CSV', 'test/qa.csv'))
+    cli.add_argument('--questions', type=int, default=64, help="Сколько вопросов из CSV задать на каждом уровне")
+    cli.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    cli.add_argument('--fake-latency', type=float, default=0.0,
+                     help="Заменить эмбеддинги и LLM задержкой в секундах (без сети и ключей)")
+    cli.add_argument('--cache', action='store_true', help="Не отключать кэш ответов")
+    asyncio.run(main(cli.parse_args()))
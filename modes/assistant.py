@@ -6,6 +6,8 @@ from aiogram.types import Message
 from aiogram.filters import Command
 from openai import AsyncOpenAI
 
+from modes.outbound import send_long_message
+
 load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -72,7 +74,7 @@ async def process_message(message: Message, bot: Bot):
                 }]
             )
         USER_LAST_RESPONSE_ID[user_id] = response.id
-        await message.answer(response.output_text, parse_mode=None)
+        await send_long_message(bot, message.chat.id, response.output_text, parse_mode=None)
     except Exception as err:
         await message.answer(f"🚫 Произошла ошибка. Попробуйте команду /reset. [{str(err)}]")
 
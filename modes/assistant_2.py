@@ -10,15 +10,20 @@ import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import aiofiles
 
+from modes.outbound import send_long_message
+from modes.embeddings import for_mode
+
 load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
+# Эмбеддинги базы знаний: KB_EMBEDDINGS=gemini (по умолчанию), local или openai
+kb_embeddings = for_mode("KB", "gemini")
+
 # Используйте актуальные имена моделей. Gemini 1.5 модели хорошо подходят для мультимодальности.
 GENERATION_MODEL_NAME = "gemini-1.5-flash-latest"
-EMBEDDING_MODEL_NAME = "models/text-embedding-004"
 AUDIO_TRANSCRIPTION_MODEL_NAME = "gemini-1.5-flash-latest"  # Для транскрипции
 
 DATA_DIR = "static/knowledge_files"  # Папка с файлами знаний по умолчанию
@@ -95,21 +100,8 @@ async def embed_chunks(text_chunks: list[str]) -> np.ndarray | None:
     if not text_chunks:
         return None
     try:
-        all_embeddings = []
-        # Gemini API для text-embedding-004 рекомендует до 100 текстов на запрос
-        batch_size = 100
-        for i in range(0, len(text_chunks), batch_size):
-            batch = text_chunks[i:i + batch_size]
-            result = await genai.embed_content_async(
-                model=EMBEDDING_MODEL_NAME,
-                content=batch,  # Передаем батч
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-            all_embeddings.extend(result['embedding'])
-
-        if not all_embeddings:  # Если по какой-то причине эмбеддинги не были созданы
-            return None
-        return np.array(all_embeddings).reshape(len(text_chunks), -1)
+        # Провайдер сам разбивает тексты на пачки и берёт уже посчитанные эмбеддинги из кэша
+        return await kb_embeddings.aembed(text_chunks)
     except Exception as e:
         logger.error(f"❌ Ошибка эмбеддинга: {e}")
         return None
@@ -212,12 +204,7 @@ async def retrieve_relevant_chunks(query: str, top_n: int = MAX_RAG_CHUNKS) -> l
         return []
 
     try:
-        query_embedding_result = await genai.embed_content_async(
-            model=EMBEDDING_MODEL_NAME,
-            content=query,
-            task_type="RETRIEVAL_QUERY"
-        )
-        query_embedding = np.array(query_embedding_result['embedding']).reshape(1, -1)
+        query_embedding = await kb_embeddings.aembed([query], 'query')
 
         similarities = cosine_similarity(query_embedding, RAG_DATA["embeddings"])[0]
 
@@ -505,11 +492,8 @@ async def process_message(message: Message, bot: Bot):
 
         try:
             response = await chat_session.send_message_async(prompt_for_gemini)
-            await bot.edit_message_text(  # Редактируем сообщение "Думаю..." на ответ
-                chat_id=chat_id,
-                text=response.text,
-                message_id=think_msg.message_id
-            )
+            await send_long_message(bot, chat_id, response.text, parse_mode=None,  # Редактируем сообщение "Думаю..." на ответ
+                                    edit_message_id=think_msg.message_id)
             logger.info(f"Ответ успешно отправлен пользователю {user_id}.")
         except Exception as e:
             logger.error(f"❌ Ошибка взаимодействия с Gemini API при генерации ответа: {e}")
@@ -8,6 +8,8 @@ from aiogram.types import Message
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from modes.outbound import send_long_message
+
 load_dotenv()
 
 # Конфигурация
@@ -219,5 +221,5 @@ async def finish_interview(message: Message, state: FSMContext):
     report = await generate_medical_report(answers)
     await message.answer("mode4:\n✅ Опрос завершен! Спасибо!")
     formatted_report = f"🩺   Медицинское заключение:\n\n{report}"
-    await message.answer(formatted_report)
+    await send_long_message(message.bot, message.chat.id, formatted_report, parse_mode=None)
     await state.clear()
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from news_include.cache import SqliteCache, content_hash
+
+load_dotenv()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def embedding_cache():
+    # Общий кэш эмбеддингов по (модель, назначение, текст); пустой EMBEDDING_CACHE отключает его
+    global _cache
+    with _cache_lock:
+        path = os.getenv('EMBEDDING_CACHE', 'cache/embeddings.sqlite')
+        if _cache is None and path:
+            _cache = SqliteCache(path, max_bytes=int(os.getenv('EMBEDDING_CACHE_MAX_MB', 512)) * 2 ** 20)
+        return _cache
+
+
+class EmbeddingProvider(Embeddings, ABC):
+    # Общая часть провайдеров: пакетная обработка и кэш. Наследники реализуют _embed(texts, kind),
+    # где kind - 'document' или 'query', и при необходимости асинхронный _aembed.
+    # Совместим с LangChain Embeddings, поэтому подходит для FAISS-хранилищ как есть.
+
+    key = None
+    batch_size = 64
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    @abstractmethod
+    def _embed(self, texts, kind):
+        pass
+
+    async def _aembed(self, texts, kind):
+        return await asyncio.to_thread(self._embed, texts, kind)
+
+    def _cache_key(self, text, kind):
+        return content_hash(self.key, kind, text)
+
+    def _lookup(self, texts, kind):
+        if self.cache is None:
+            return {}
+        found = self.cache.get_many([self._cache_key(text, kind) for text in texts])
+        return {text: np.frombuffer(found[self._cache_key(text, kind)], dtype=np.float32)
+                for text in texts if self._cache_key(text, kind) in found}
+
+    def _store(self, vectors, kind):
+        if self.cache is not None and vectors:
+            self.cache.set_many({self._cache_key(text, kind): np.asarray(vector, dtype=np.float32).tobytes()
+                                 for text, vector in vectors.items()})
+
+    def _batches(self, texts):
+        for start in range(0, len(texts), self.batch_size):
+            yield texts[start:start + self.batch_size]
+
+    def embed(self, texts, kind='document'):
+        vectors = self._lookup(texts, kind)
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        computed = {}
+        for batch in self._batches(missing):
+            computed.update(zip(batch, self._embed(batch, kind)))
+        self._store(computed, kind)
+        vectors.update(computed)
+        return np.vstack([np.asarray(vectors[text], dtype=np.float32) for text in texts]) if texts else None
+
+    async def aembed(self, texts, kind='document'):
+        vectors = self._lookup(texts, kind)
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        computed = {}
+        for batch in self._batches(missing):
+            computed.update(zip(batch, await self._aembed(batch, kind)))
+        self._store(computed, kind)
+        vectors.update(computed)
+        return np.vstack([np.asarray(vectors[text], dtype=np.float32) for text in texts]) if texts else None
+
+    def embed_documents(self, texts):
+        return self.embed(list(texts)).tolist() if texts else []
+
+    def embed_query(self, text):
+        return self.embed([text], 'query')[0].tolist()
+
+    async def aembed_documents(self, texts):
+        return (await self.aembed(list(texts))).tolist() if texts else []
+
+    async def aembed_query(self, text):
+        return (await self.aembed([text], 'query'))[0].tolist()
+
+
+class OpenAIProvider(EmbeddingProvider):
+
+    def __init__(self, cache=None, model=None):
+        from langchain_openai import OpenAIEmbeddings
+
+        super().__init__(cache)
+        self.client = OpenAIEmbeddings(openai_api_key=os.getenv('OPENAI_API_KEY'),
+                                       **({'model': model} if model else {}))
+        self.key = f"openai:{self.client.model}"
+
+    def _embed(self, texts, kind):
+        return self.client.embed_documents(texts)
+
+    async def _aembed(self, texts, kind):
+        return await self.client.aembed_documents(texts)
+
+
+class GeminiProvider(EmbeddingProvider):
+    # Gemini принимает до 100 текстов на запрос
+    batch_size = 100
+
+    def __init__(self, cache=None, model=None):
+        import google.generativeai as genai
+
+        super().__init__(cache)
+        if os.getenv('GOOGLE_API_KEY'):
+            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+        self.genai = genai
+        self.model = model or os.getenv('GEMINI_EMBEDDING_MODEL', 'models/text-embedding-004')
+        self.key = f"gemini:{self.model}"
+
+    @staticmethod
+    def _task_type(kind):
+        return 'RETRIEVAL_QUERY' if kind == 'query' else 'RETRIEVAL_DOCUMENT'
+
+    def _embed(self, texts, kind):
+        return self.genai.embed_content(model=self.model, content=texts, task_type=self._task_type(kind))['embedding']
+
+    async def _aembed(self, texts, kind):
+        result = await self.genai.embed_content_async(model=self.model, content=texts,
+                                                      task_type=self._task_type(kind))
+        return result['embedding']
+
+
+class LocalProvider(EmbeddingProvider):
+    # Локальная модель эмбеддингов на CPU (transformers, mean pooling, L2-нормировка).
+    # По умолчанию multilingual-e5-small: ~118M параметров, русский язык, префиксы query:/passage:.
+    # LOCAL_EMBEDDING_INT8=1 включает динамическую int8-квантизацию линейных слоёв, как у RuBERT.
+
+    def __init__(self, cache=None, model=None, int8=None):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        super().__init__(cache)
+        self.torch = torch
+        self.model_name = model or os.getenv('LOCAL_EMBEDDING_MODEL', 'intfloat/multilingual-e5-small')
+        self.int8 = int8 if int8 is not None else os.getenv('LOCAL_EMBEDDING_INT8', '0') == '1'
+        self.batch_size = int(os.getenv('LOCAL_EMBEDDING_BATCH', 32))
+        self.max_length = int(os.getenv('LOCAL_EMBEDDING_MAX_TOKENS', 256))
+        self.prefixes = {
+            'query': os.getenv('LOCAL_EMBEDDING_QUERY_PREFIX', 'query: '),
+            'document': os.getenv('LOCAL_EMBEDDING_DOCUMENT_PREFIX', 'passage: '),
+        }
+        self.key = f"local:{self.model_name}{':int8' if self.int8 else ''}"
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModel.from_pretrained(self.model_name)
+        self.model.eval()
+        if self.int8:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self._lock = threading.Lock()
+
+    def _embed(self, texts, kind):
+        encoded = self.tokenizer([self.prefixes[kind] + text for text in texts], padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors='pt')
+        with self._lock, self.torch.inference_mode():
+            hidden = self.model(**encoded).last_hidden_state
+        mask = encoded['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        pooled = self.torch.nn.functional.normalize(pooled, p=2, dim=1)
+        return pooled.numpy()
+
+    async def _aembed(self, texts, kind):
+        # Свой поток, а не пул инференса RuBERT: запросы FAQ не должны ждать пакеты новостей.
+        # Одновременный доступ к модели сериализуется self._lock внутри _embed
+        return await asyncio.to_thread(self._embed, texts, kind)
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'gemini': GeminiProvider,
+    'local': LocalProvider,
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name):
+    # Один экземпляр на провайдера: локальная модель загружается в память один раз
+    if name not in PROVIDERS:
+        raise ValueError(f"Неизвестный провайдер эмбеддингов {name!r}, доступны: {', '.join(PROVIDERS)}")
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = PROVIDERS[name](cache=embedding_cache())
+        return _providers[name]
+
+
+def for_mode(mode, default):
+    # Провайдер выбирается переменной <MODE>_EMBEDDINGS, например FAQ_EMBEDDINGS=local
+    return get_provider(os.getenv(f"{mode}_EMBEDDINGS", default))
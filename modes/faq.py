@@ -1,36 +1,27 @@
+import asyncio
 import os
-import pandas as pd
 from aiogram.types import Message
 from aiogram.enums import ContentType
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
 
+from modes.outbound import send_long_message
+from modes.faq_index import FaqIndex
+from modes.faq_cache import AnswerCache
+from modes.embeddings import for_mode
+
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+FAQ_CSV = os.getenv("FAQ_CSV", "test/qa.csv")
 
-vectorstore = None
-qa_chain = None
-
-
-def load_faq_data():
-    """Loads FAQ data from CSV and initializes vector store"""
-    global vectorstore, qa_chain
-    data = pd.read_csv("test/qa.csv")
-
-    texts = [f"problem: {row['question']}\nanswer_variant: {row['answer']}"
-             for _, row in data.iterrows()]
-    metadatas = [{"answer_variant": row["answer"]} for _, row in data.iterrows()]
-
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-    vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
-
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
+embeddings = for_mode("FAQ", "openai")
+faq_index = FaqIndex(os.getenv("FAQ_INDEX", "cache/faq_index"), embeddings, embeddings.key)
+answer_cache = AnswerCache(os.getenv("FAQ_ANSWER_CACHE", "cache/faq_answers.sqlite"))
 
-    # Custom prompt template
-    template = """You are a technical assistant. Analyze the provided answers and generate a final response.
+# Custom prompt template
+template = """You are a technical assistant. Analyze the provided answers and generate a final response.
 
 Context:
 {context}
@@ -45,13 +36,27 @@ Rules:
 
 Answer:"""
 
-    QA_PROMPT = PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
-    )
+QA_PROMPT = PromptTemplate(
+    template=template,
+    input_variables=["context", "question"]
+)
+
+vectorstore = None
+qa_chain = None
+faq_version = None
 
+# Обновления базы знаний выполняются по одному
+_reload_lock = asyncio.Lock()
+# Одновременные обращения к LLM ограничены, остальные вопросы ждут своей очереди
+_answer_slots = None
+_answered = 0
+
+
+def build_chain(store):
+    """Creates the RetrievalQA chain over the given vector store"""
+    retriever = store.as_retriever(search_kwargs={"k": 5})
     llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.3, max_tokens=128)
-    qa_chain = RetrievalQA.from_chain_type(
+    return RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
         retriever=retriever,
@@ -60,17 +65,72 @@ Answer:"""
     )
 
 
-# Load FAQ data on startup
-load_faq_data()
+def load_faq_data(csv_path=FAQ_CSV):
+    """Syncs the on-disk FAQ index with the CSV and swaps in a new QA chain"""
+    global vectorstore, qa_chain, faq_version
+    added, removed = faq_index.sync(csv_path)
+    store = faq_index.vectorstore()
+    chain = build_chain(store)
+    # Вопросы, начатые до подмены, дорабатывают на старой цепочке со старым индексом
+    vectorstore, qa_chain, faq_version = store, chain, faq_index.version
+    return added, removed
+
+
+async def reload_faq_data(csv_path=FAQ_CSV):
+    """Re-indexes off the event loop; concurrent questions keep using the current chain"""
+    async with _reload_lock:
+        return await asyncio.to_thread(load_faq_data, csv_path)
+
+
+def _get_slots():
+    global _answer_slots
+    if _answer_slots is None:
+        _answer_slots = asyncio.Semaphore(int(os.getenv("FAQ_CONCURRENCY", 8)))
+    return _answer_slots
+
+
+class FaqNotReady(Exception):
+    pass
+
+
+def _log_stats():
+    # Метрики кэша пишем раз в FAQ_STATS_EVERY ответов, а не на каждый вопрос
+    global _answered
+    _answered += 1
+    if _answered % int(os.getenv("FAQ_STATS_EVERY", 100)) == 0:
+        print(f"Кэш ответов FAQ: {answer_cache.stats()}")
+
+
+async def _answer(question):
+    store, chain, version = vectorstore, qa_chain, faq_version
+    if store is None or chain is None:
+        raise FaqNotReady("База знаний FAQ ещё загружается")
+    answer = answer_cache.get(question, version)
+    if answer is None:
+        vector = await embeddings.aembed_query(question)
+        answer = answer_cache.get_similar(vector, version)
+        if answer is None:
+            docs = store.similarity_search_by_vector(vector, k=5)
+            async with _get_slots():
+                result = await chain.combine_documents_chain.ainvoke({"input_documents": docs, "question": question})
+            answer = result["output_text"]
+            answer_cache.put(question, vector, answer, version)
+    _log_stats()
+    return answer
+
+
+async def answer_question(question, timeout=None):
+    """Answers without blocking the event loop: cache first, then retrieval with the same query embedding"""
+    return await asyncio.wait_for(_answer(question), timeout or float(os.getenv("FAQ_TIMEOUT", 60)))
 
 
 async def process_message(message: Message, bot):
     """Handles incoming messages in FAQ mode"""
     user_question = message.text
 
-    if user_question.startswith("/update"):
-        load_faq_data()
-        await message.reply("✅ База знаний обновлена!")
+    if user_question and user_question.startswith("/update"):
+        added, removed = await reload_faq_data()
+        await message.reply(f"✅ База знаний обновлена! Добавлено: {added}, удалено: {removed}")
         return
 
     elif message.content_type == ContentType.DOCUMENT:
@@ -80,18 +140,32 @@ async def process_message(message: Message, bot):
             await message.reply("⚠️ Пожалуйста, загрузите CSV-файл.")
             return
 
-        file_path = "../test/qa.csv"
+        # Новый файл сначала индексируется из временной копии и заменяет FAQ_CSV только при успехе
+        tmp_path = FAQ_CSV + ".upload"
         file = await bot.get_file(document.file_id)
         file_content = await bot.download_file(file.file_path)
-        with open(file_path, "wb") as f:
+        with open(tmp_path, "wb") as f:
             f.write(file_content.getvalue())
 
-        load_faq_data()
-        await message.reply("✅ Файл получен! База знаний обновлена!")
+        try:
+            added, removed = await reload_faq_data(tmp_path)
+        except Exception as e:
+            os.remove(tmp_path)
+            await message.reply(f"⚠️ Не удалось обработать файл: {e}")
+            return
+        os.replace(tmp_path, FAQ_CSV)
+        await message.reply(f"✅ Файл получен! База знаний обновлена! Добавлено: {added}, удалено: {removed}")
         return
 
     # Process normal text question
-    result = qa_chain.invoke({"query": user_question})
-    response_text = result["result"]
+    try:
+        response_text = await answer_question(user_question)
+    except FaqNotReady:
+        await message.reply("⏳ База знаний ещё загружается, попробуйте через минуту.")
+        return
+    except asyncio.TimeoutError:
+        await message.reply("⏳ Не удалось получить ответ вовремя, попробуйте ещё раз.")
+        return
 
-    await message.reply('mode1:\n ' + response_text)
+    await send_long_message(bot, message.chat.id, 'mode1:\n ' + response_text, parse_mode=None,
+                            reply_to_message_id=message.message_id)
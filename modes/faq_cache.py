@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+from news_include.cache import SqliteCache, content_hash
+
+
+def normalize_question(text):
+    return ' '.join(text.casefold().replace('ё', 'е').split()).strip(' ?!.')
+
+
+class AnswerCache:
+    # Кэш ответов FAQ в два уровня: точное совпадение нормализованного вопроса (SQLite, переживает
+    # перезапуск) и смысловой повтор - косинусная близость эмбеддинга вопроса к уже отвеченным.
+    # Оба уровня привязаны к версии индекса FAQ: после обновления базы старые ответы не отдаются.
+
+    def __init__(self, path, threshold=None, max_semantic=None):
+        self.threshold = threshold or float(os.getenv('FAQ_SEMANTIC_THRESHOLD', 0.95))
+        self.max_semantic = max_semantic or int(os.getenv('FAQ_SEMANTIC_SIZE', 2000))
+        self.exact = SqliteCache(path, max_entries=int(os.getenv('FAQ_ANSWER_CACHE_SIZE', 20000))) if path else None
+        self.hits = {'exact': 0, 'semantic': 0}
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self._semantic = deque(maxlen=self.max_semantic)
+        self._matrix = None
+
+    @staticmethod
+    def _key(question, version):
+        return content_hash(version, normalize_question(question))
+
+    def get(self, question, version):
+        answer = self.exact.get(self._key(question, version)) if self.exact else None
+        if answer is not None:
+            with self._lock:
+                self.hits['exact'] += 1
+        return answer
+
+    def get_similar(self, vector, version):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            if self._version != version or not self._semantic:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack([entry[0] for entry in self._semantic])
+            scores = self._matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits['semantic'] += 1
+            return self._semantic[best][1]
+
+    def put(self, question, vector, answer, version):
+        if self.exact:
+            self.exact.set(self._key(question, version), answer)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            if self._version != version:
+                self._version = version
+                self._semantic.clear()
+            self._semantic.append((vector, answer))
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits['exact'] + self.hits['semantic']
+            total = hits + self.misses
+            return {
+                'exact_hits': self.hits['exact'],
+                'semantic_hits': self.hits['semantic'],
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0,
+                'semantic_entries': len(self._semantic),
+            }
@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import faiss
+import numpy as np
+import pandas as pd
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from news_include.cache import content_hash
+
+
+def normalize(text):
+    return ' '.join(str(text).split())
+
+
+def row_hash(question, answer):
+    return content_hash(normalize(question), normalize(answer))
+
+
+def row_id(digest):
+    # Стабильный int64-идентификатор строки в FAISS из её хэша
+    return int(digest[:15], 16)
+
+
+def read_rows(csv_path):
+    # {хэш строки: (вопрос, ответ)} в порядке файла, точные повторы схлопываются
+    data = pd.read_csv(csv_path)
+    rows = {}
+    for question, answer in zip(data['question'], data['answer']):
+        rows.setdefault(row_hash(question, answer), (str(question), str(answer)))
+    return rows
+
+
+def make_document(question, answer):
+    return Document(page_content=f"problem: {question}\nanswer_variant: {answer}",
+                    metadata={"answer_variant": answer})
+
+
+class FaqIndex:
+    # Индекс FAQ на диске. Каждая версия - отдельный каталог с FAISS-индексом (IndexIDMap2,
+    # id строки = хэш вопроса и ответа), документами и манифестом хэшей; файл CURRENT указывает
+    # на действующую версию и подменяется атомарно. При старте индекс читается с диска целиком.
+    # Обновление инкрементальное: удалённые строки вычёркиваются по id, эмбеддинги пачками
+    # считаются только для новых и изменённых строк.
+
+    def __init__(self, directory, embeddings, model_key, batch_size=None):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.model_key = model_key
+        self.batch_size = batch_size or int(os.getenv('FAQ_EMBED_BATCH', 64))
+        self.version = 0
+        self.index = None
+        self.docs = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _version_dir(self, version):
+        return os.path.join(self.directory, f"v{version:06d}")
+
+    def _read_current(self):
+        path = os.path.join(self.directory, 'CURRENT')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            version_dir = os.path.join(self.directory, f.read().strip())
+        with open(os.path.join(version_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return version_dir, manifest
+
+    def load(self):
+        current = self._read_current()
+        if current is None:
+            return False
+        version_dir, manifest = current
+        self.version = manifest['version']
+        if manifest.get('model') != self.model_key:
+            print(f"Индекс FAQ построен моделью {manifest.get('model')}, нужна {self.model_key} - пересобираем")
+            return False
+        with open(os.path.join(version_dir, 'docs.json'), 'r', encoding='utf-8') as f:
+            docs = json.load(f)
+        self.index = faiss.read_index(os.path.join(version_dir, 'index.faiss'))
+        self.docs = {digest: tuple(row) for digest, row in docs.items()}
+        return True
+
+    def _embed(self, rows):
+        texts = [make_document(question, answer).page_content for question, answer in rows]
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+    def _save(self, index, docs):
+        version = self.version + 1
+        version_dir = self._version_dir(version)
+        os.makedirs(version_dir, exist_ok=True)
+        faiss.write_index(index, os.path.join(version_dir, 'index.faiss'))
+        with open(os.path.join(version_dir, 'docs.json'), 'w', encoding='utf-8') as f:
+            json.dump(docs, f, ensure_ascii=False)
+        with open(os.path.join(version_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'model': self.model_key, 'rows': list(docs)}, f)
+
+        tmp_path = os.path.join(self.directory, 'CURRENT.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(version_dir))
+        os.replace(tmp_path, os.path.join(self.directory, 'CURRENT'))
+
+        # Предыдущую версию оставляем, чтобы к ней можно было откатиться, переписав CURRENT
+        for name in os.listdir(self.directory):
+            if name.startswith('v') and name < f"v{version - 1:06d}":
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        return version
+
+    def _apply(self, rows, added, removed):
+        # Новая версия строится на копии: живой индекс остаётся нетронутым до подмены
+        if self.index is not None:
+            index = faiss.clone_index(self.index)
+            if removed:
+                index.remove_ids(np.array([row_id(digest) for digest in removed], dtype=np.int64))
+        else:
+            index = None
+
+        for start in range(0, len(added), self.batch_size):
+            batch = added[start:start + self.batch_size]
+            vectors = self._embed([rows[digest] for digest in batch])
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            index.add_with_ids(vectors, np.array([row_id(digest) for digest in batch], dtype=np.int64))
+        return index
+
+    def sync(self, csv_path):
+        # Приводит индекс к содержимому CSV. Возвращает (добавлено, удалено)
+        with self._lock:
+            if self.index is None:
+                self.load()
+            rows = read_rows(csv_path)
+            if not rows:
+                raise ValueError(f"В {csv_path} нет ни одной строки FAQ")
+            added = [digest for digest in rows if digest not in self.docs]
+            removed = [digest for digest in self.docs if digest not in rows]
+            if self.index is not None and not added and not removed:
+                return 0, 0
+
+            index = self._apply(rows, added, removed)
+            docs = {digest: list(rows[digest]) for digest in rows}
+            self.version = self._save(index, docs)
+            self.index, self.docs = index, {digest: tuple(row) for digest, row in docs.items()}
+            print(f"Индекс FAQ v{self.version}: добавлено {len(added)}, удалено {len(removed)}, "
+                  f"всего {len(docs)}")
+            return len(added), len(removed)
+
+    def vectorstore(self):
+        documents = {digest: make_document(question, answer) for digest, (question, answer) in self.docs.items()}
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=self.index,
+            docstore=InMemoryDocstore(documents),
+            index_to_docstore_id={row_id(digest): digest for digest in documents},
+        )
+
+
+if __name__ == '__main__':
+    from modes.embeddings import PROVIDERS, get_provider
+
+    cli = argparse.ArgumentParser(description="Офлайн-сборка индекса FAQ")
+    commands = cli.add_subparsers(dest='command', required=True)
+
+    build_cmd = commands.add_parser('build', help="Построить или обновить индекс по CSV")
+    build_cmd.add_argument('--csv', default=os.getenv('FAQ_CSV', 'test/qa.csv'))
+    build_cmd.add_argument('--index', default=os.getenv('FAQ_INDEX', 'cache/faq_index'))
+    build_cmd.add_argument('--provider', choices=list(PROVIDERS), default=os.getenv('FAQ_EMBEDDINGS', 'openai'))
+
+    args = cli.parse_args()
+    provider = get_provider(args.provider)
+    faq_index = FaqIndex(args.index, provider, provider.key)
+    added, removed = faq_index.sync(args.csv)
+    print(f"Индекс {args.index} v{faq_index.version} ({provider.key}): добавлено {added}, удалено {removed}")
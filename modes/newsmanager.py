@@ -1,11 +1,21 @@
 import os
+import asyncio
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-from news_include.rubert import RubertClassifier
+from news_include.rubert import get_classifier, classifier_metrics
+from news_include.inference import executor as inference, InferenceBusy
 from news_include.parser import Parser
-from news_include.chatgpt import shortener_deepseek as shortener, summarizer_deepseek as summarizer
+from news_include.chatgpt import shortener_deepseek as shortener, summarizer_mapreduce as summarizer, \
+    SHORTENER_PROMPT_VERSION
+from news_include.cache import SqliteCache, content_hash
+from news_include.llm import client as llm
 from news_include.videoparser import VideoParser
+from modes.outbound import send_long_message
+from news_include.crawler import crawler, store
+from news_include.kgd_index import kgd_index
+
+from datetime import datetime, timedelta
 
 from re import compile, match
 
@@ -14,21 +24,82 @@ from dotenv import load_dotenv
 load_dotenv()
 vid = VideoParser()
 
+# Краткие содержания статей: ключ - ссылка, хэш текста и версия модели/промпта
+summary_cache = SqliteCache(os.getenv('SUMMARY_CACHE', 'cache/summaries.sqlite'),
+                            ttl=int(os.getenv('SUMMARY_CACHE_TTL', 30 * 24 * 3600)),
+                            max_bytes=int(os.getenv('SUMMARY_CACHE_MAX_MB', 50)) * 2 ** 20)
+# Счётчик запросов новостей для периодического вывода метрик кэша
+_queries = 0
 
-def filter_by_theme(articles, classes):
-    new_articles = {}
-    for link, data in articles.items():
-        buff = []
 
-        for probe in range(len(classes)):
-            if data[2][probe] > float(os.getenv("INTENSE")):
-                buff.append(classes[probe])
-        if buff:
+def _log_stats():
+    # Метрики кэша пишем раз в SUMMARY_STATS_EVERY запросов новостей, а не на каждый запрос
+    global _queries
+    _queries += 1
+    if _queries % int(os.getenv("SUMMARY_STATS_EVERY", 20)) == 0:
+        print("Кэш кратких содержаний:", summary_cache.stats())
+
+
+async def load_classifier():
+    # Загрузка в пуле инференса: event loop не блокируется, даже если модель ещё не в памяти
+    return await inference.run(get_classifier, os.getenv("RUBERT"), timeout=600)
+
+
+async def warmup():
+    # Загружаем RuBERT при старте бота, чтобы первый запрос не ждал загрузку модели
+    await load_classifier()
+    print("RuBERT готов:", classifier_metrics())
+
+
+def filter_by_theme(articles, classes, scores):
+    # scores - матрица (статьи x темы) из RubertClassifier.predict_batch
+    passed = scores > float(os.getenv("INTENSE"))
+    new_articles = {}
+    for row, (link, data) in enumerate(articles.items()):
+        if passed[row].any():
             new_articles[link] = data[0:2]
-            new_articles[link].append(buff)
+            new_articles[link].append([classes[col] for col in passed[row].nonzero()[0]])
     return new_articles
 
 
+def lead(text, limit=400):
+    # Начало статьи вместо краткого содержания, если LLM не ответил
+    text = ' '.join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind('. ', 0, limit)
+    return text[:cut + 1] if cut > 0 else text[:limit] + '…'
+
+
+def summary_key(link, text):
+    return content_hash(link, content_hash(text), llm.model, SHORTENER_PROMPT_VERSION)
+
+
+async def summarize(link, text, limit, timeout):
+    key = summary_key(link, text)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async with limit:
+        try:
+            summary = await asyncio.wait_for(shortener(text), timeout)
+        except Exception as e:
+            print(f"Не удалось сократить статью {link}: {type(e).__name__} {e}")
+            return lead(text)
+    summary_cache.set(key, summary)
+    return summary
+
+
+async def summarize_all(articles):
+    # articles - пары (ссылка, текст); сокращаем параллельно, порядок результатов сохраняется
+    limit = asyncio.Semaphore(int(os.getenv('SUMMARY_CONCURRENCY', 4)))
+    timeout = float(os.getenv('SUMMARY_TIMEOUT', 120))
+    summaries = await asyncio.gather(*(summarize(link, text, limit, timeout) for link, text in articles))
+    _log_stats()
+    return summaries
+
+
 def parse_days(text, use_default=False):
     date = compile(r'\d{2}.\d{2}.\d{4}')
     if use_default and not (text.isdigit() or date.match(text) or '-' in text):
@@ -55,27 +126,121 @@ def parse_days(text, use_default=False):
         return ('int', days_int)
 
 
-async def send_long_message(bot, user_id, text):
-    MAX_LENGTH = 4000
+def format_item(link, date, themes, summary):
+    return (
+        f'Дата: {date}\n'
+        f'Темы: {", ".join(themes)}\n'
+        f'{summary}\n'
+        f'Ссылка: {link}\n\n---'
+    )
 
-    if len(text) <= MAX_LENGTH:
-        await bot.send_message(user_id, text, parse_mode='Markdown')
-        return
 
-    message_parts = []
-    for i in range(0, len(text), MAX_LENGTH):
-        message_parts.append(text[i:i + MAX_LENGTH])
+def from_store(site, days):
+    start, _ = Parser.parse_days(days)
+    return crawler.covers(site) and start >= datetime.now().date() - timedelta(days=crawler.days)
 
-    for i, part in enumerate(message_parts):
-        part_indicator = f"Часть {i + 1}/{len(message_parts)}: " if len(message_parts) > 1 else ""
-        await bot.send_message(user_id, f"{part_indicator}{part}", parse_mode='MarkdownV2')
+
+async def iter_source(parser, site, days):
+    if from_store(site, days):
+        for link, (date, text) in store.query(site, *Parser.parse_days(days)).items():
+            yield link, date, text
+    else:
+        async for item in parser.iter_news(site, days):
+            yield item
+
+
+async def stream_news(bot, user_id, parser, rubert, site, days, classes):
+    # Конвейер скачивание -> тематика -> сокращение: каждая готовая статья сразу уходит пользователю,
+    # а статусное сообщение показывает, сколько статей найдено, проверено и отправлено
+    threshold = float(os.getenv("INTENSE"))
+    batch_size = int(os.getenv('STREAM_CLASSIFY_BATCH', 8))
+    limit = asyncio.Semaphore(int(os.getenv('SUMMARY_CONCURRENCY', 4)))
+    timeout = float(os.getenv('SUMMARY_TIMEOUT', 120))
+
+    progress = {'found': 0, 'checked': 0, 'matched': 0, 'sent': 0}
+    status = await bot.send_message(user_id, "📰 Ищу статьи...")
+    last_status = {'text': status.text, 'at': 0.0}
+    fetched = asyncio.Queue()
+
+    async def update_status(final=False):
+        text = (f"📰 {'Готово' if final else 'Обрабатываю'}: найдено {progress['found']}, "
+                f"проверено {progress['checked']}, по темам {progress['matched']}, "
+                f"отправлено {progress['sent']}")
+        now = asyncio.get_running_loop().time()
+        if text == last_status['text'] or (not final and now - last_status['at'] < 2):
+            return
+        last_status.update(text=text, at=now)
+        try:
+            await bot.edit_message_text(text, chat_id=user_id, message_id=status.message_id)
+        except Exception as e:
+            print(f"Не удалось обновить статус: {e}")
+
+    async def produce():
+        try:
+            async for item in iter_source(parser, site, days):
+                progress['found'] += 1
+                await fetched.put(item)
+        finally:
+            await fetched.put(None)
+
+    async def deliver(link, date, text, themes):
+        summary = await summarize(link, text, limit, timeout)
+        await send_long_message(bot, user_id, format_item(link, date, themes, summary))
+        progress['sent'] += 1
+        await update_status()
+
+    producer = asyncio.create_task(produce())
+    deliveries = []
+    try:
+        finished = False
+        while not finished:
+            # Забираем всё, что уже скачано, и классифицируем одним батчем
+            batch = [await fetched.get()]
+            while not fetched.empty() and len(batch) < batch_size:
+                batch.append(fetched.get_nowait())
+            if batch[-1] is None:
+                finished = True
+                batch.pop()
+            if not batch:
+                continue
+
+            scores = await inference.run(rubert.predict_batch, [text for _, _, text in batch], classes)
+            for (link, date, text), row in zip(batch, scores):
+                progress['checked'] += 1
+                themes = [classes[j] for j in (row > threshold).nonzero()[0]]
+                if themes:
+                    progress['matched'] += 1
+                    deliveries.append(asyncio.create_task(deliver(link, date, text, themes)))
+            await update_status()
+
+        await producer
+        for result in await asyncio.gather(*deliveries, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Не удалось отправить статью: {type(result).__name__} {result}")
+    except (InferenceBusy, asyncio.TimeoutError) as e:
+        print(f"Классификация не выполнена: {type(e).__name__} {e}")
+        await bot.send_message(user_id, "Сервер перегружен, попробуйте повторить запрос позже")
+        # Уже отправленные статьи дойдут (finally), но итог "Готово"/"не найдено" не показываем
+        return
+    finally:
+        producer.cancel()
+        await asyncio.gather(*deliveries, return_exceptions=True)
+
+    await update_status(final=True)
+    if not progress['found']:
+        await bot.send_message(user_id, "Не удалось получить новости")
+    elif not progress['matched']:
+        await bot.send_message(user_id, "Статей по заданным темам за этот период не найдено")
+    _log_stats()
 
 
 async def process_message(message, bot):
+    vidid = vid.getytid(message.text.split(',')[0].strip())
+    if vidid:
+        vid.prefetch(vidid)
     await bot.send_message(message.from_user.id, "Ищу новости...")
 
     # Classes
-    rubert = RubertClassifier(os.getenv("RUBERT"))
     parser = Parser(message.from_user.id, bot)
 
     # Variables
@@ -94,16 +259,16 @@ async def process_message(message, bot):
             classes = list(map(lambda x: x.strip(), message.text.split(',')[1:]))
             vidid = vid.getytid(url)
             if vidid:
-                subtitle = vid.parse(vidid)
-                summ = summarizer(subtitle, classes)
+                subtitle = await vid.load(vidid)
+                summ = await summarizer(subtitle, classes)
                 result = vid.postprocess(summ, url)
                 await send_long_message(bot, message.from_user.id, result)
                 return
         else:
             vidid = vid.getytid(message.text)
             if vidid:
-                subtitle = vid.parse(vidid)
-                summ = summarizer(subtitle, 'any')
+                subtitle = await vid.load(vidid)
+                summ = await summarizer(subtitle, 'any')
                 result = vid.postprocess(summ, message.text.strip())
                 await send_long_message(bot, message.from_user.id, result)
                 return
@@ -145,15 +310,41 @@ async def process_message(message, bot):
 
     # Parse KGD
     if first == '6':
-        data = await parser.get_news(site, days, nums=classes)
+        if not await kgd_index.ensure(parser):
+            await bot.send_message(message.from_user.id, "Не удалось получить страницу КГД, попробуйте позже")
+            return
+        data = kgd_index.query(classes, *Parser.parse_days(days))
+        if not data:
+            await bot.send_message(message.from_user.id, "Формы ФНО за этот период не найдены")
+            return
         text = ""
         for element in data:
             text += f"Код ФНО: {element[0]}\nДата: {element[1]}\nСкачать: {element[2]}\n\n---\n\n"
         await send_long_message(bot, message.from_user.id, text)
         return
 
-    # Parse news
-    articles = await parser.get_news(site, days)
+    # Если прогрев при старте не удался, модель загружается здесь, при первом запросе новостей
+    try:
+        rubert = await load_classifier()
+    except (InferenceBusy, asyncio.TimeoutError) as e:
+        print(f"Классификатор не загружен: {type(e).__name__} {e}")
+        await bot.send_message(message.from_user.id, "Сервер перегружен, попробуйте повторить запрос позже")
+        return
+    except Exception as e:
+        print(f"Не удалось загрузить RuBERT: {type(e).__name__} {e}")
+        await bot.send_message(message.from_user.id, "Классификатор тем недоступен, попробуйте позже")
+        return
+
+    if os.getenv('NEWS_STREAMING', '1') == '1':
+        await stream_news(bot, message.from_user.id, parser, rubert, site, days, classes)
+        return
+
+    # Parse news: из хранилища фонового краулера, если оно покрывает период, иначе живой обход
+    if from_store(site, days):
+        articles = store.query(site, *Parser.parse_days(days))
+        print(f"Статьи {site} взяты из хранилища: {len(articles)}")
+    else:
+        articles = await parser.get_news(site, days)
     if not articles:
         await bot.send_message(message.from_user.id, "Не удалось получить новости")
         return
@@ -163,27 +354,24 @@ async def process_message(message, bot):
                            f"Найдено {len(articles)} новостей за заданный период.\nПроверяю тематику...")
 
     # Check themes
-    probes = []
-    for text in texts:
-        probes.append(rubert.predict(text, classes, normalize=False))
-
-    [articles[key].append(probes[i]) for i, key in enumerate(articles.keys())]
-    print(articles)
+    try:
+        scores = await inference.run(rubert.predict_batch, texts, classes)
+    except (InferenceBusy, asyncio.TimeoutError) as e:
+        print(f"Классификация не выполнена: {type(e).__name__} {e}")
+        await bot.send_message(message.from_user.id, "Сервер перегружен, попробуйте повторить запрос позже")
+        return
+    print(scores)
 
-    articles = filter_by_theme(articles, classes)
+    articles = filter_by_theme(articles, classes, scores)
     news = []
 
     await bot.send_message(message.from_user.id,
                            f"{len(articles)} новых статей соотвествуют желаемым темам. Обрабатываю их...")
 
     # Enshorten text and add to message
-    for link, data in articles.items():
-        news.append(
-            f'Дата: {data[0]}\n'
-            f'Темы: {", ".join(data[2])}\n'
-            f'{shortener(data[1])}\n'
-            f'Ссылка: {link}\n\n---'
-        )
+    summaries = await summarize_all([(link, data[1]) for link, data in articles.items()])
+    for (link, data), summary in zip(articles.items(), summaries):
+        news.append(format_item(link, data[0], data[2], summary))
 
     text = ''
     for txt in news:
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import re
+import time
+from itertools import accumulate
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Лимит Telegram - 4096 символов, считаются в единицах UTF-16
+MAX_LENGTH = 4096
+PART_RESERVE = 32  # место под "Часть i/n: "
+
+# Сущности, внутри которых резать нельзя: блоки кода, код, ссылки, жирный/курсив (Markdown) и HTML-теги
+ENTITY = re.compile(
+    r'```.*?```'
+    r'|`[^`\n]*`'
+    r'|\[[^\]\n]*\]\([^)\s]*\)'
+    r'|\*[^*\n]+\*'
+    r'|_[^_\n]+_'
+    r'|<(\w+)[^>]*>.*?</\1>',
+    re.DOTALL
+)
+
+# Предпочтительные места разреза по убыванию: абзац, строка, конец предложения, пробел
+BOUNDARIES = (re.compile(r'\n\s*\n'), re.compile(r'\n'), re.compile(r'[.!?…]\s'), re.compile(r'\s'))
+
+
+def utf16_len(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_message(text, limit=MAX_LENGTH):
+    if utf16_len(text) <= limit:
+        return [text] if text.strip() else []
+
+    # units[i] - длина text[:i] в UTF-16
+    units = [0, *accumulate(2 if ord(ch) > 0xFFFF else 1 for ch in text)]
+    protected = [False] * (len(text) + 1)
+    for m in ENTITY.finditer(text):
+        for i in range(m.start() + 1, m.end()):
+            protected[i] = True
+
+    parts = []
+    start = 0
+    while start < len(text):
+        # Самая дальняя позиция, при которой часть влезает в лимит
+        end = start
+        lo, hi = start, len(text)
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if units[mid] - units[start] <= limit:
+                end, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+        if end >= len(text):
+            parts.append(text[start:])
+            break
+
+        cut = None
+        min_cut = start + (end - start) // 2
+        for boundary in BOUNDARIES:
+            positions = [m.end() for m in boundary.finditer(text, start, end)
+                         if min_cut <= m.end() <= end and not protected[m.end()]]
+            if positions:
+                cut = positions[-1]
+                break
+        if cut is None:
+            # Нет подходящей границы: режем в любом месте вне сущности, в крайнем случае - по лимиту
+            cut = next((i for i in range(end, start, -1) if not protected[i]), end)
+
+        parts.append(text[start:cut])
+        start = cut
+
+    return [part for part in parts if part.strip()]
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Outbox:
+    # Очередь исходящих сообщений с учётом лимитов Telegram: около 1 сообщения в секунду на чат
+    # (с небольшим запасом на всплеск) и 30 в секунду на бота. Части одного длинного сообщения
+    # отправляются подряд, не перемешиваясь с другими ответами в тот же чат.
+
+    def __init__(self):
+        self.chat_rate = float(os.getenv('TG_CHAT_RATE', 1))
+        self.chat_burst = int(os.getenv('TG_CHAT_BURST', 3))
+        self.global_bucket = None
+        self._chats = {}
+
+    def _chat(self, chat_id):
+        if chat_id not in self._chats:
+            self._chats[chat_id] = (asyncio.Lock(), TokenBucket(self.chat_rate, self.chat_burst))
+        return self._chats[chat_id]
+
+    async def _call(self, chat, method, **kwargs):
+        # chat - ключ лимита; chat_id для Telegram передаётся в kwargs вместе с остальными параметрами
+        if self.global_bucket is None:
+            self.global_bucket = TokenBucket(float(os.getenv('TG_GLOBAL_RATE', 30)), 30)
+        _, bucket = self._chat(chat)
+        while True:
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await method(**kwargs)
+            except TelegramRetryAfter as e:
+                print(f"Telegram просит подождать {e.retry_after} c (чат {chat})")
+                await asyncio.sleep(e.retry_after)
+
+    async def _deliver(self, bot, chat_id, text, parse_mode, message_id=None, **kwargs):
+        if message_id is not None:
+            method, params = bot.edit_message_text, {'message_id': message_id}
+        else:
+            method, params = bot.send_message, kwargs
+        try:
+            return await self._call(chat_id, method, chat_id=chat_id, text=text, parse_mode=parse_mode, **params)
+        except TelegramBadRequest as e:
+            if parse_mode is None or "parse" not in str(e).lower():
+                raise
+            # Разметка не разобралась - отправляем ту же часть простым текстом
+            print(f"Разметка {parse_mode} отклонена Telegram ({e}), отправляю без неё")
+            return await self._call(chat_id, method, chat_id=chat_id, text=text, parse_mode=None, **params)
+
+    async def send_long_message(self, bot, chat_id, text, parse_mode='Markdown', edit_message_id=None, **kwargs):
+        parts = split_message(text, MAX_LENGTH - PART_RESERVE)
+        if not parts:
+            return []
+        lock, _ = self._chat(chat_id)
+        sent = []
+        async with lock:
+            for i, part in enumerate(parts):
+                if len(parts) > 1:
+                    part = f"Часть {i + 1}/{len(parts)}: {part}"
+                if i == 0 and edit_message_id is not None:
+                    sent.append(await self._deliver(bot, chat_id, part, parse_mode, message_id=edit_message_id))
+                else:
+                    sent.append(await self._deliver(bot, chat_id, part, parse_mode, **kwargs))
+        return sent
+
+
+outbox = Outbox()
+
+
+async def send_long_message(bot, chat_id, text, parse_mode='Markdown', **kwargs):
+    return await outbox.send_long_message(bot, chat_id, text, parse_mode=parse_mode, **kwargs)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def content_hash(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SqliteCache:
+    # Ключ-значение на SQLite с вытеснением давно не использованных записей (LRU) и опциональным TTL.
+    # Используется из event loop и из потоков инференса, поэтому все обращения идут под блокировкой.
+
+    def __init__(self, path, max_entries=None, ttl=None, max_bytes=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL, size INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite ограничивает число параметров в запросе
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, value, created FROM entries WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, value, created in rows:
+                    if not self._expired(created, now):
+                        found[key] = value
+            missing = [key for key in keys if key not in found]
+            if found:
+                self._db.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                                     [(now, key) for key in found])
+            if missing and self.ttl is not None:
+                self._db.executemany('DELETE FROM entries WHERE key = ? AND created < ?',
+                                     [(key, now - self.ttl) for key in missing])
+            self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        now = time.time()
+        rows = [(key, value, now, now, len(value) if isinstance(value, (bytes, str)) else 8)
+                for key, value in items.items()]
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO entries (key, value, created, accessed, size) '
+                                 'VALUES (?, ?, ?, ?, ?)', rows)
+            self._evict()
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._db.commit()
+
+    def _evict(self):
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        if self.max_entries is not None and count > self.max_entries:
+            self._db.execute('DELETE FROM entries WHERE key IN '
+                             '(SELECT key FROM entries ORDER BY accessed LIMIT ?)', (count - self.max_entries,))
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Удаляем самые старые по обращению записи, пока суммарный размер не войдёт в лимит
+            self._db.execute('DELETE FROM entries WHERE key IN ('
+                             'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total '
+                             'FROM entries) WHERE total > ?)', (self.max_bytes,))
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        total = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,16 +1,20 @@
+import asyncio
 import os
-import requests
+import re
 
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 
 from dotenv import load_dotenv
 
+from news_include.llm import client
+from news_include.videoparser import VideoParser
+
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
-def shortener(text):
+async def shortener(text):
     template = """Rewrite the article given to you in the shortest possible form.
 
 Article:
@@ -36,11 +40,11 @@ Answer:"""
     )
 
     chain = prompt | llm
-    response = chain.invoke({"article": text})
+    response = await chain.ainvoke({"article": text})
     return response.content
 
 
-def summarizer(text, themes='any'):
+async def summarizer(text, themes='any'):
     template = """Summarize the video subtitle transcript given to you.
 
 Transcript:
@@ -70,11 +74,11 @@ Answer:"""
     )
 
     chain = prompt | llm
-    response = chain.invoke({"transcript": text, "themes": themes})
+    response = await chain.ainvoke({"transcript": text, "themes": themes})
     return response.content
 
 
-def link_finder(text, time):
+async def link_finder(text, time):
     template = """Find all links to the news articles *present strictly within* the html page given to you below. Identify news articles based on the link structure (like starting with '/news/') or surrounding context within the provided HTML.
 
 Page:
@@ -110,11 +114,15 @@ Answer:"""
     else:
         time = f"only one day - {time[1]}"
         print(text, time)
-    response = chain.invoke({"page": text, "time": time})
+    response = await chain.ainvoke({"page": text, "time": time})
     return response.content
 
 
-def shortener_deepseek(text):
+# Увеличивайте при изменении промпта shortener_deepseek - от версии зависит кэш кратких содержаний
+SHORTENER_PROMPT_VERSION = 1
+
+
+async def shortener_deepseek(text):
     template = """Rewrite the article given to you in the shortest possible form.
 
 Article:
@@ -127,15 +135,10 @@ Rules:
 
 Answer:"""
 
-    response = requests.post("http://alexsoft.kz:11434/api/generate", json={
-        "model": "deepseek-r1:1.5b",
-        "prompt": template.format(article=text),
-        "stream": False
-    })
-    return response.json()["response"]
+    return await client.generate(template.format(article=text))
 
 
-def summarizer_deepseek(text, themes='any'):
+async def summarizer_deepseek(text, themes='any'):
     template = """Summarize the video subtitle transcript given to you.
 
 Transcript:
@@ -152,15 +155,10 @@ Rules:
 
 Answer:"""
 
-    response = requests.post("http://alexsoft.kz:11434/api/generate", json={
-        "model": "deepseek-r1:1.5b",
-        "prompt": template.format(transcript=text, themes=themes),
-        "stream": False
-    })
-    return response.json()["response"]
+    return await client.generate(template.format(transcript=text, themes=themes))
 
 
-def link_finder_deepseek(text, time):
+async def link_finder_deepseek(text, time):
     template = """Find all links to the news articles *present strictly within* the html page given to you below. Identify news articles based on the link structure (like starting with '/news/') or surrounding context within the provided HTML.
 
 Page:
@@ -184,31 +182,61 @@ Answer:"""
         time_str = f"only one day - {time[1]}"
         print(text, time_str)
 
-    try:
-        payload = {
-            "model": "deepseek-r1:1.5b",
-            "prompt": template,
-            "stream": False,
-            "temperature": 0.7,
-            "max_tokens": 500
-        }
-
-        base_url = "http://alexsoft.kz:11434"
-        session = requests.Session()
-
-        response = session.post(
-            f"{base_url}/api/generate",
-            json=payload
-        )
-        response.raise_for_status()
-
-        return response.json().get("response", "")
-    except requests.RequestException as e:
-        raise Exception(f"Failed to generate response: {str(e)}")
-
-    #response = requests.post("http://alexsoft.kz:11434/api/generate", json={
-    #    "model": "deepseek-r1:1.5b",
-    #    "prompt": template.format(page=text, time=time_str),
-    #    "stream": False
-    #})
-    #return response.json()["response"]
+    return await client.generate(template.format(page=text, time=time_str), temperature=0.7, num_predict=500)
+
+
+def strip_reasoning(text):
+    # deepseek-r1 пишет рассуждения в <think>...</think>, в итоговый ответ они не нужны
+    return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+
+
+async def merger_deepseek(parts, themes='any'):
+    template = """Merge the lists of news found in consecutive parts of one video transcript into a single list.
+
+Lists:
+{parts}
+
+Themes:
+{themes}
+
+Rules:
+1. Keep only news about the given themes and sign each news item with its themes.
+2. Merge duplicate news items into one, keeping the earliest timecode.
+3. Keep every timecode exactly as written, in format [t=seconds]. Never invent or change timecodes.
+4. Order news items by timecode.
+5. Respond in Russian.
+
+Answer:"""
+
+    return await client.generate(template.format(parts='\n\n---\n\n'.join(parts), themes=themes))
+
+
+async def summarizer_mapreduce(text, themes='any', budget=None):
+    # Длинный транскрипт: окна по границам таймкодов суммаризируются параллельно,
+    # затем списки новостей сливаются (при необходимости в несколько уровней)
+    budget = budget or int(os.getenv('TRANSCRIPT_WINDOW_TOKENS', 3000))
+    # Подсчёт токенов по строкам транскрипта - синхронная работа, выносим из event loop
+    windows = await asyncio.to_thread(VideoParser.split_windows, text, budget)
+    if len(windows) <= 1:
+        return strip_reasoning(await summarizer_deepseek(text, themes))
+
+    print(f"Транскрипт разбит на {len(windows)} окон")
+    parts = [strip_reasoning(part) for part in
+             await asyncio.gather(*(summarizer_deepseek(window, themes) for window in windows))]
+
+    while len(parts) > 1:
+        groups, current, size = [], [], 0
+        for part in parts:
+            tokens = VideoParser.count_tokens(part)
+            if current and size + tokens > budget:
+                groups.append(current)
+                current, size = [], 0
+            current.append(part)
+            size += tokens
+        groups.append(current)
+        if len(groups) == len(parts):
+            # Каждая часть сама по себе больше бюджета - сливаем попарно, чтобы уровень сократился
+            groups = [parts[i:i + 2] for i in range(0, len(parts), 2)]
+        parts = [strip_reasoning(merged) for merged in
+                 await asyncio.gather(*(merger_deepseek(group, themes) for group in groups))]
+    return parts[0]
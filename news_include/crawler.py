@@ -0,0 +1,134 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from news_include.cache import content_hash
+from news_include.parser import Parser
+
+load_dotenv()
+
+# Сайты, которые краулер обновляет в фоне. KGD публикует не статьи, а формы ФНО,
+# поэтому он обслуживается отдельно и в хранилище статей не попадает.
+CRAWL_SITES = ('ODINC', 'UCHET', 'PRO1C', 'MYBUH', 'GOS24')
+
+
+class ArticleStore:
+    # Инкрементальное хранилище статей: одна запись на ссылку, повторы текста внутри сайта
+    # отбрасываются, выборка идёт по индексу (сайт, дата публикации)
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY, site TEXT, published TEXT, text TEXT, hash TEXT, fetched REAL);
+            CREATE INDEX IF NOT EXISTS articles_site_published ON articles (site, published);
+            CREATE UNIQUE INDEX IF NOT EXISTS articles_site_hash ON articles (site, hash);
+            CREATE TABLE IF NOT EXISTS crawls (site TEXT PRIMARY KEY, crawled REAL, found INTEGER);
+        ''')
+        self._db.commit()
+
+    @staticmethod
+    def _published(date_str):
+        # Ссылки без даты (0.0.0000 от link_finder) датируются днём первого обнаружения
+        try:
+            return datetime.strptime(date_str.strip(), '%d.%m.%Y').date().isoformat()
+        except (ValueError, AttributeError):
+            return datetime.now().date().isoformat()
+
+    def add(self, site, articles):
+        now = time.time()
+        rows = [(url, site, self._published(data[0]), data[1], content_hash(data[1]), now)
+                for url, data in articles.items() if data[1]]
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany('INSERT OR IGNORE INTO articles (url, site, published, text, hash, fetched) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            added = self._db.total_changes - before
+            self._db.execute('INSERT OR REPLACE INTO crawls (site, crawled, found) VALUES (?, ?, ?)',
+                             (site, now, len(rows)))
+            self._db.commit()
+        return added
+
+    def known_urls(self, site):
+        with self._lock:
+            return {row[0] for row in self._db.execute('SELECT url FROM articles WHERE site = ?', (site,))}
+
+    def is_fresh(self, site, max_age):
+        with self._lock:
+            row = self._db.execute('SELECT crawled FROM crawls WHERE site = ?', (site,)).fetchone()
+        return row is not None and time.time() - row[0] <= max_age
+
+    def query(self, site, start, end):
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT url, published, text FROM articles WHERE site = ? AND published BETWEEN ? AND ? '
+                'ORDER BY published DESC', (site, start.isoformat(), end.isoformat())
+            ).fetchall()
+        return {url: [datetime.fromisoformat(published).strftime('%d.%m.%Y'), text] for url, published, text in rows}
+
+
+class NewsCrawler:
+
+    def __init__(self, store, interval=None, days=None):
+        self.store = store
+        self.interval = interval or int(os.getenv('CRAWL_INTERVAL', 1800))
+        self.days = days or int(os.getenv('CRAWL_DAYS', 30))
+        self._task = None
+
+    @property
+    def sites(self):
+        return [os.getenv(name) for name in CRAWL_SITES if os.getenv(name)]
+
+    def covers(self, site):
+        # Сайт можно отдавать из хранилища, если он краулится и последний обход не устарел
+        return site in self.sites and self.store.is_fresh(site, self.interval * 2)
+
+    async def crawl_site(self, site):
+        parser = Parser(None, None)
+        started = time.perf_counter()
+        articles = await parser.get_news(site, ('int', self.days), skip=self.store.known_urls(site))
+        if articles is None:
+            print(f"Краулер: не удалось обойти {site}")
+            return 0
+        added = await asyncio.to_thread(self.store.add, site, articles)
+        print(f"Краулер: {site} - {len(articles)} новых ссылок, добавлено {added} "
+              f"за {time.perf_counter() - started:.1f} c")
+        return added
+
+    async def run(self):
+        while True:
+            for site in self.sites:
+                try:
+                    await self.crawl_site(site)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Краулер: ошибка при обходе {site}: {type(e).__name__} {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+store = ArticleStore(os.getenv('NEWS_STORE', 'cache/news.sqlite'))
+crawler = NewsCrawler(store)
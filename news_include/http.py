@@ -0,0 +1,37 @@
+import os
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Один пул соединений на процесс: keep-alive, кэш DNS и лимиты на хост.
+# Открывается при старте бота и закрывается при остановке (run.main).
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv('HTTP_POOL_SIZE', 100)),
+            limit_per_host=int(os.getenv('HTTP_POOL_PER_HOST', 8)),
+            ttl_dns_cache=int(os.getenv('HTTP_DNS_TTL', 300)),
+            use_dns_cache=True,
+            keepalive_timeout=float(os.getenv('HTTP_KEEPALIVE', 60)),
+            enable_cleanup_closed=True,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=20, connect=20),
+        )
+        print("Создан общий пул соединений aiohttp")
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        print("Общий пул соединений aiohttp закрыт")
+    _session = None
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+
+from news_include.cache import SqliteCache
+
+load_dotenv()
+
+
+class HttpCache:
+    # HTTP-кэш страниц: учитывает Cache-Control/Expires, хранит ETag и Last-Modified для
+    # условных запросов, тела страниц лежат на диске в сжатом виде с ограничением общего размера
+
+    def __init__(self, path, max_bytes, default_ttl):
+        self.store = SqliteCache(path, max_bytes=max_bytes)
+        self.default_ttl = default_ttl
+        self.revalidated = 0
+
+    def lookup(self, url):
+        blob = self.store.get(url)
+        if blob is None:
+            return None
+        return json.loads(zlib.decompress(blob))
+
+    @staticmethod
+    def is_fresh(entry):
+        return time.time() < entry['expires']
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _expires(self, headers):
+        now = time.time()
+        directives = {}
+        for part in headers.get('Cache-Control', '').lower().split(','):
+            name, _, value = part.strip().partition('=')
+            if name:
+                directives[name] = value.strip('"')
+
+        if 'no-store' in directives:
+            return None
+        if 'no-cache' in directives:
+            return now
+        for name in ('s-maxage', 'max-age'):
+            if directives.get(name, '').isdigit():
+                return now + int(directives[name]) - int(headers.get('Age', 0) or 0)
+        try:
+            if headers.get('Expires'):
+                return parsedate_to_datetime(headers['Expires']).timestamp()
+        except (TypeError, ValueError):
+            return now
+        try:
+            # Эвристика RFC 9111: 10% возраста документа, но не больше default_ttl
+            if headers.get('Last-Modified'):
+                age = now - parsedate_to_datetime(headers['Last-Modified']).timestamp()
+                return now + max(0, min(age / 10, self.default_ttl))
+        except (TypeError, ValueError):
+            pass
+        return now + self.default_ttl
+
+    def save(self, url, headers, body):
+        expires = self._expires(headers)
+        if expires is None:
+            self.store.delete(url)
+            return
+        entry = {
+            'body': body,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'cache_control': headers.get('Cache-Control'),
+            'expires': expires,
+        }
+        self.store.set(url, zlib.compress(json.dumps(entry, ensure_ascii=False).encode('utf-8')))
+
+    def refresh(self, url, entry, headers):
+        # Ответ 304: тело прежнее, обновляем только валидаторы и срок свежести
+        self.revalidated += 1
+        merged = {
+            'ETag': headers.get('ETag') or entry.get('etag'),
+            'Last-Modified': headers.get('Last-Modified') or entry.get('last_modified'),
+            'Cache-Control': headers.get('Cache-Control') or entry.get('cache_control'),
+        }
+        for name in ('Expires', 'Age'):
+            merged[name] = headers.get(name)
+        self.save(url, {k: v for k, v in merged.items() if v}, entry['body'])
+        return entry['body']
+
+    def stats(self):
+        return {**self.store.stats(), 'revalidated': self.revalidated}
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    path = os.getenv('HTTP_CACHE', 'cache/http.sqlite')
+    if _cache is None and path:
+        _cache = HttpCache(path,
+                           max_bytes=int(os.getenv('HTTP_CACHE_MAX_MB', 200)) * 2 ** 20,
+                           default_ttl=int(os.getenv('HTTP_CACHE_TTL', 300)))
+    return _cache
@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class InferenceBusy(Exception):
+    pass
+
+
+class InferenceExecutor:
+    # Пул потоков для синхронного инференса (PyTorch отпускает GIL), чтобы не блокировать event loop.
+    # Очередь ограничена: workers + queue_size задач одновременно, остальные ждут свободного места
+    # не дольше timeout, после чего получают InferenceBusy.
+
+    def __init__(self, workers=None, queue_size=None, timeout=None):
+        self.workers = workers or int(os.getenv('INFERENCE_WORKERS', 1))
+        self.queue_size = queue_size or int(os.getenv('INFERENCE_QUEUE', 8))
+        self.timeout = timeout or float(os.getenv('INFERENCE_TIMEOUT', 120))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        self._slots = None
+        self.stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _get_slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        return self._slots
+
+    @property
+    def pending(self):
+        return self.stats['submitted'] - self.stats['completed']
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        slots = self._get_slots()
+
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            raise InferenceBusy(f"Очередь инференса заполнена ({self.pending} задач)")
+
+        loop = asyncio.get_running_loop()
+        self.stats['submitted'] += 1
+        future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+
+        # Слот освобождается только когда поток реально закончил работу, а не по таймауту ожидания
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, slots))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                          max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            future.cancel()
+            raise
+
+    def _release(self, slots):
+        self.stats['completed'] += 1
+        slots.release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+executor = InferenceExecutor()
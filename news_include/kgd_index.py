@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left, bisect_right
+
+from bs4 import BeautifulSoup as bs
+from dotenv import load_dotenv
+
+from news_include.cache import content_hash
+from news_include.parser import Parser
+
+load_dotenv()
+
+
+class KgdIndex:
+    # Индекс форм ФНО с сайта КГД: код формы -> отсортированные даты и ссылки.
+    # Таблица перечитывается только когда страница изменилась (хэш тела; неизменная
+    # страница приходит из HTTP-кэша или ответом 304).
+
+    def __init__(self, url=None, interval=None):
+        self.url = url or os.getenv('KGD')
+        self.interval = interval or int(os.getenv('KGD_REFRESH', 3600))
+        self.forms = {}
+        self.page_hash = None
+        self.updated = 0.0
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @staticmethod
+    def build(rows):
+        grouped = {}
+        for code, date, link in rows:
+            grouped.setdefault(code, []).append((date, link))
+        forms = {}
+        for code, entries in grouped.items():
+            entries.sort(key=lambda entry: entry[0])
+            forms[code] = ([date for date, _ in entries], [link for _, link in entries])
+        return forms
+
+    async def refresh(self, parser=None):
+        async with self._lock:
+            parser = parser or Parser(None, None)
+            html = await parser._get_html(self.url)
+            if not html:
+                print("Индекс КГД: не удалось получить страницу")
+                return False
+            self.updated = time.time()
+            page_hash = content_hash(html)
+            if page_hash == self.page_hash:
+                return False
+
+            forms = await asyncio.to_thread(lambda: self.build(Parser.kgd_rows(bs(html, 'lxml'))))
+            # Подмена целиком: запросы видят либо старый, либо новый индекс
+            self.forms, self.page_hash = forms, page_hash
+            print(f"Индекс КГД обновлён: {len(forms)} форм")
+            return True
+
+    async def ensure(self, parser=None):
+        # True, если индекс построен хотя бы раз. Устаревший индекс отдаём, даже если обновить
+        # его не удалось; False - страницу КГД ещё ни разу не удалось получить и разобрать
+        if self.page_hash is None or time.time() - self.updated > self.interval:
+            try:
+                await self.refresh(parser)
+            except Exception as e:
+                print(f"Индекс КГД: ошибка обновления: {type(e).__name__} {e}")
+        return self.page_hash is not None
+
+    def query(self, codes, start, end):
+        res = []
+        for code in dict.fromkeys(codes):
+            if code not in self.forms:
+                continue
+            dates, links = self.forms[code]
+            for i in range(bisect_left(dates, start), bisect_right(dates, end)):
+                res.append((code, dates[i].strftime('%d.%m.%Y'), links[i]))
+        return res
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Индекс КГД: ошибка обновления: {type(e).__name__} {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.url and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+kgd_index = KgdIndex()
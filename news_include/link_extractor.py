@@ -0,0 +1,179 @@
+import json
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+
+from dotenv import load_dotenv
+
+from news_include.cache import SqliteCache
+
+load_dotenv()
+
+MONTHS = {
+    'января': '01', 'февраля': '02', 'марта': '03',
+    'апреля': '04', 'мая': '05', 'июня': '06',
+    'июля': '07', 'августа': '08', 'сентября': '09',
+    'октября': '10', 'ноября': '11', 'декабря': '12',
+    'қаңтар': '01', 'ақпан': '02', 'наурыз': '03',
+    'сәуір': '04', 'мамыр': '05', 'маусым': '06',
+    'шілде': '07', 'тамыз': '08', 'қыркүйек': '09',
+    'қазан': '10', 'қараша': '11', 'желтоқсан': '12'
+}
+
+DATE_PATTERNS = (
+    (re.compile(r'\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b'), lambda m: (m[1], m[2], m[3])),
+    (re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b'), lambda m: (m[3], m[2], m[1])),
+    (re.compile(r'\b(\d{1,2})\s+(' + '|'.join(MONTHS) + r')\s+(\d{4})', re.IGNORECASE),
+     lambda m: (m[1], MONTHS[m[2].lower()], m[3])),
+)
+
+SKIP_PATHS = re.compile(r'/(tag|tags|category|categories|author|page|search|login|auth|rss)(/|$)', re.IGNORECASE)
+
+# Сколько уровней вверх по DOM искать дату рядом со ссылкой
+DATE_SEARCH_DEPTH = 3
+
+
+def find_date(text):
+    for pattern, parts in DATE_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            day, month, year = parts(m)
+            try:
+                return datetime(int(year), int(month), int(day)).date()
+            except ValueError:
+                continue
+    return None
+
+
+def url_signature(path):
+    # Шаблон пути: числовые сегменты и слаги заменяются заглушками, /news/123-title/ -> news/{s}
+    segments = [s for s in path.split('/') if s]
+    signature = []
+    for segment in segments:
+        if segment.isdigit():
+            signature.append('{n}')
+        elif '-' in segment or '_' in segment or len(segment) > 24 or re.search(r'\d', segment):
+            signature.append('{s}')
+        else:
+            signature.append(segment)
+    return '/'.join(signature)
+
+
+def dom_signature(anchor):
+    parts = []
+    node = anchor.parent
+    for _ in range(3):
+        if node is None or node.name in (None, '[document]', 'html', 'body'):
+            break
+        classes = '.'.join(sorted(node.get('class', []))[:2])
+        parts.append(f"{node.name}.{classes}" if classes else node.name)
+        node = node.parent
+    return '>'.join(reversed(parts))
+
+
+def anchor_date(anchor):
+    node = anchor
+    for _ in range(DATE_SEARCH_DEPTH + 1):
+        if node is None:
+            break
+        # Поднялись выше элемента списка - дальше даты относятся к другим статьям
+        if node is not anchor and len({a['href'] for a in node.find_all('a', href=True, limit=10)}) > 1:
+            break
+        time_el = node.find('time') if node is not anchor else None
+        if time_el is not None:
+            date = find_date(time_el.get('datetime', '')) or find_date(time_el.get_text(' ', strip=True))
+            if date:
+                return date
+        date = find_date(node.get_text(' ', strip=True)[:300])
+        if date:
+            return date
+        node = node.parent
+    return None
+
+
+class LinkExtractor:
+    # Находит ссылки на статьи без LLM: группирует ссылки по шаблону пути и положению в DOM,
+    # берёт самую крупную «статейную» группу и даты из соседних <time> или текста.
+    # Найденное правило запоминается для домена и применяется напрямую при следующих обходах.
+
+    def __init__(self, rules_path=None, threshold=None):
+        self.threshold = threshold if threshold is not None else float(os.getenv('LINK_CONFIDENCE', 0.6))
+        path = rules_path or os.getenv('LINK_RULES', 'cache/link_rules.sqlite')
+        self.rules = SqliteCache(path) if path else None
+
+    @staticmethod
+    def candidates(soup, page_url):
+        host = urlparse(page_url).netloc
+        page = page_url.rstrip('/')
+        seen = {}
+        for anchor in soup.find_all('a', href=True):
+            link = urljoin(page_url, anchor['href'].strip())
+            parsed = urlparse(link)
+            if parsed.scheme not in ('http', 'https') or parsed.netloc != host:
+                continue
+            link = link.split('#')[0]
+            if link.rstrip('/') == page or not parsed.path.strip('/') or SKIP_PATHS.search(parsed.path):
+                continue
+            key = (url_signature(parsed.path), dom_signature(anchor))
+            seen.setdefault(link, (key, anchor))
+        return seen
+
+    def _cluster(self, candidates):
+        clusters = defaultdict(list)
+        for link, (key, anchor) in candidates.items():
+            clusters[key].append((link, anchor))
+        return clusters
+
+    @staticmethod
+    def _score(key, members, dates):
+        signature = key[0]
+        if '{' not in signature:
+            return 0.0
+        dated = sum(1 for link, _ in members if dates.get(link))
+        size = min(len(members) / 5, 1.0)
+        return size * (0.5 + 0.5 * dated / len(members))
+
+    def extract(self, soup, page_url):
+        # Возвращает ([(дата или None, ссылка)], уверенность)
+        candidates = self.candidates(soup, page_url)
+        if not candidates:
+            return [], 0.0
+        clusters = self._cluster(candidates)
+        domain = urlparse(page_url).netloc
+
+        rule = self.rules.get(domain) if self.rules else None
+        if rule:
+            key = tuple(json.loads(rule))
+            if key in clusters:
+                members = clusters[key]
+                return [(anchor_date(anchor), link) for link, anchor in members], 1.0
+
+        best_key, best_score, best_dates = None, 0.0, {}
+        for key, members in clusters.items():
+            dates = {link: anchor_date(anchor) for link, anchor in members}
+            score = self._score(key, members, dates)
+            if score > best_score:
+                best_key, best_score, best_dates = key, score, dates
+
+        if best_key is None:
+            return [], 0.0
+        if self.rules and best_score >= self.threshold:
+            self.rules.set(domain, json.dumps(best_key))
+        links = [(best_dates[link], link) for link, _ in clusters[best_key]]
+        print(f"Эвристика ссылок для {domain}: шаблон {best_key}, {len(links)} ссылок, уверенность {best_score:.2f}")
+        return links, best_score
+
+    @staticmethod
+    def pruned_page(soup, page_url, limit=200):
+        # Сжатый список ссылок для LLM вместо всего HTML: дата | ссылка | текст ссылки
+        lines = []
+        for link, (_, anchor) in list(LinkExtractor.candidates(soup, page_url).items())[:limit]:
+            date = anchor_date(anchor)
+            title = anchor.get_text(' ', strip=True)[:120]
+            lines.append(f"{date.strftime('%d.%m.%Y') if date else ''} | {link} | {title}")
+        return '\n'.join(lines)
+
+
+extractor = LinkExtractor()
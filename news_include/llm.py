@@ -0,0 +1,84 @@
+import asyncio
+import os
+import random
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class LLMError(Exception):
+    pass
+
+
+class _RetryableError(LLMError):
+    pass
+
+
+class LLMClient:
+    # Асинхронный клиент Ollama-совместимого /api/generate: свой пул соединений,
+    # ограничение числа одновременных генераций, таймаут и повторы с джиттером
+
+    def __init__(self, base_url=None, model=None, concurrency=None, timeout=None, retries=None):
+        self.base_url = (base_url or os.getenv('LLM_BASE_URL', 'http://localhost:11434')).rstrip('/')
+        self.model = model or os.getenv('LLM_MODEL', 'deepseek-r1:1.5b')
+        self.concurrency = concurrency or int(os.getenv('LLM_CONCURRENCY', 4))
+        self.timeout = timeout or float(os.getenv('LLM_TIMEOUT', 180))
+        self.retries = retries if retries is not None else int(os.getenv('LLM_RETRIES', 3))
+        self._session = None
+        self._slots = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency * 2, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def _get_slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    @staticmethod
+    def _backoff(attempt):
+        # Экспоненциальная задержка с полным джиттером, чтобы повторы не шли пачкой
+        return random.uniform(0, min(30.0, 2 ** attempt))
+
+    async def generate(self, prompt, model=None, **options):
+        payload = {
+            'model': model or self.model,
+            'prompt': prompt,
+            'stream': False,
+        }
+        if options:
+            payload['options'] = options
+
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_slots():
+                    session = self._get_session()
+                    async with session.post(f"{self.base_url}/api/generate", json=payload) as response:
+                        if response.status >= 400:
+                            error = f"HTTP {response.status}: {(await response.text())[:200]}"
+                            if response.status == 429 or response.status >= 500:
+                                raise _RetryableError(error)
+                            raise LLMError(error)
+                        data = await response.json(content_type=None)
+                        return data.get('response', '')
+            except (aiohttp.ClientError, asyncio.TimeoutError, _RetryableError) as e:
+                last_error = e
+                print(f"LLM запрос не удался (попытка {attempt + 1}/{self.retries + 1}): {type(e).__name__} {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(self._backoff(attempt))
+        raise LLMError(f"Failed to generate response: {last_error}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+client = LLMClient()
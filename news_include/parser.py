@@ -1,4 +1,5 @@
 import os
+import random
 
 import newspaper
 from bs4 import BeautifulSoup as bs
@@ -7,17 +8,33 @@ import asyncio
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
-import requests
 from urllib.parse import urljoin, urlparse
 from lxml import etree
 import io
 
+from news_include import http, http_cache
+from news_include.cache import SqliteCache
 from news_include.chatgpt import link_finder_deepseek as link_finder
+from news_include.link_extractor import extractor
+from news_include.site_handlers import sites
 
 from newspaper import Article
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
+# Извлечение текста newspaper'ом - синхронный разбор lxml, выполняем его в отдельном пуле
+_extract_pool = ThreadPoolExecutor(max_workers=int(os.getenv('EXTRACT_WORKERS', 4)),
+                                   thread_name_prefix='extract')
+
+# Найденные новостные страницы по доменам, чтобы не перебирать NEWS_PAGE_VARS на каждом запросе
+_news_pages_path = os.getenv('NEWS_PAGE_CACHE', 'cache/news_pages.sqlite')
+_news_pages = SqliteCache(_news_pages_path, ttl=int(os.getenv('NEWS_PAGE_TTL', 7 * 24 * 3600))) \
+    if _news_pages_path else None
+# Домены, где ни один вариант не подошёл, помним недолго и под отдельными ключами
+_news_pages_missing = SqliteCache(_news_pages_path, ttl=int(os.getenv('NEWS_PAGE_MISS_TTL', 3600))) \
+    if _news_pages_path else None
+
 
 class Parser:
     def __init__(self, id, bot):
@@ -30,31 +47,38 @@ class Parser:
         self.id = id
         self.bot = bot
 
-        self._session = None
+        self._host_limits = {}
+        self.host_concurrency = int(os.getenv('ARTICLE_HOST_CONCURRENCY', 4))
+        self.article_retries = int(os.getenv('ARTICLE_RETRIES', 2))
+        self.fetch_stats = {}
 
     async def _get_session(self):
-        if self._session is None or self._session.closed:
-            import random
-            user_agent = random.choice(self.user_agents)
-            headers = {'User-Agent': user_agent}
-            self._session = aiohttp.ClientSession(headers=headers, timeout=self.timeout)
-            print(f"Создана новая сессия aiohttp с User-Agent: {user_agent}")
-        return self._session
-
-    async def close_session(self):
-        if self._session and not self._session.closed:
-            await self._session.close()
-            print("Сессия aiohttp закрыта.")
-            self._session = None
+        # Общий для всего процесса пул соединений (news_include.http), User-Agent задаётся на запрос
+        return http.get_session()
+
+    def _headers(self, user_agent=None):
+        return {'User-Agent': user_agent or random.choice(self.user_agents)}
 
     async def _get_html(self, url):
+        cache = http_cache.get_cache()
+        entry = cache.lookup(url) if cache else None
+        if entry and cache.is_fresh(entry):
+            return entry['body']
+
+        session = await self._get_session()
         for user_agent in self.user_agents:
-            headers = {'User-Agent': user_agent}
+            headers = self._headers(user_agent)
+            if entry:
+                headers.update(cache.conditional_headers(entry))
             try:
-                async with aiohttp.ClientSession(timeout=self.timeout, headers=headers) as session:
-                    async with session.get(url, allow_redirects=True) as response:
-                        response.raise_for_status()
-                        return await response.text()
+                async with session.get(url, allow_redirects=True, headers=headers, timeout=self.timeout) as response:
+                    if response.status == 304 and entry:
+                        return cache.refresh(url, entry, response.headers)
+                    response.raise_for_status()
+                    html = await response.text()
+                    if cache:
+                        cache.save(url, response.headers, html)
+                    return html
             except aiohttp.ClientConnectionError:
                 print(f"Connection error for {url} with User-Agent: {user_agent}")
             except aiohttp.ClientResponseError as e:
@@ -66,10 +90,15 @@ class Parser:
             await asyncio.sleep(1)  # Задержка между попытками
         return None
 
+    async def _notify(self, text):
+        # Фоновый краулер создаёт Parser без бота и пользователя
+        if self.bot is not None:
+            await self.bot.send_message(self.id, text)
+
     async def get_soup(self, url):
         html = await self._get_html(url)
         if not html:
-            await self.bot.send_message(self.id, f"Не удалось получить страницу {url}")
+            await self._notify(f"Не удалось получить страницу {url}")
             print("Failed to get HTML")
             return None
         try:
@@ -78,34 +107,18 @@ class Parser:
             print(f"BeautifulSoup error: {e}")
             return None
 
-    async def get_news(self, url, days=('int', int(os.getenv('LAST_DAYS'))), **kwargs):  # ('int', 3) ('one day', 21.04.2022) ('range', 21.04.2022, 21.05.2022)
-        handlers = {
-            #os.getenv('ODINC'): self.odinc,
-            #os.getenv('UCHET'): self.uchet,
-            #os.getenv('MYBUH'): self.mybuh,
-            #os.getenv('PRO1C'): self.pro1c,
-            #os.getenv('GOS24'): self.gos24,
+    def _handlers(self):
+        # Новостные сайты описаны декларативно в news_sites.jsonl (news_include.site_handlers)
+        return {
             os.getenv('KGD'): self.kgd
         }
+
+    async def get_news(self, url, days=('int', int(os.getenv('LAST_DAYS'))), **kwargs):  # ('int', 3) ('one day', 21.04.2022) ('range', 21.04.2022, 21.05.2022)
+        handlers = self._handlers()
         if url not in handlers:
-            url = await self.find_news_page_url(url)
-            articles = await self.get_article_list(url, days)
-            print('ARTICLES:', articles)
             data = dict()
-            for article in articles:
-                try:
-                    article_obj = Article(article[1])
-                    article_obj.download()
-                    article_obj.parse()
-                    data.setdefault(article[1], [article[0], article_obj.text])
-                except newspaper.article.ArticleException as e:
-                    article[1] = article[1].rstrip('/')
-                    article_obj = Article(article[1])
-                    article_obj.download()
-                    article_obj.parse()
-                    data.setdefault(article[1], [article[0], article_obj.text])
-                except Exception as e:
-                    print(f"Error parsing article {article[1]}: Type={type(e)}, Error={e}")
+            async for link, date, text in self.iter_news(url, days, **kwargs):
+                data.setdefault(link, [date, text])
             return data
         else:
             soup = await self.get_soup(url)
@@ -119,19 +132,128 @@ class Parser:
 
             return await handlers[url](soup, rng, **kwargs)
 
-    async def check_url_exists(self, url, session):
+    async def iter_news(self, url, days=('int', int(os.getenv('LAST_DAYS'))), **kwargs):
+        # Статьи по одной (ссылка, дата, текст) по мере готовности - для потоковой выдачи
+        if url in self._handlers():
+            data = await self.get_news(url, days, **kwargs)
+            for link, (date, text) in (data or {}).items():
+                yield link, date, text
+            return
+
+        articles, extract = None, None
+        spec = sites.get(url)
+        soup = await self.get_soup(spec.url) if spec is not None else None
+        if soup is not None:
+            try:
+                articles = spec.articles(soup, self.parse_days(days))
+                extract = lambda link, html: spec.extract_text(link, html) or self._extract_text(link, html)
+            except Exception as e:
+                print(f"Описание сайта {spec.site} не подошло ({type(e).__name__} {e}), ищем статьи общим способом")
+                articles = None
+
+        if articles is None:
+            url = await self.find_news_page_url(url)
+            articles = await self.get_article_list(url, days)
+        # Уже сохранённые краулером статьи повторно не скачиваем
+        skip = kwargs.get('skip') or ()
+        articles = [article for article in articles if article[1] not in skip]
+        print('ARTICLES:', articles)
+        async for item in self.fetch_articles(articles, extract):
+            yield item
+
+    async def fetch_articles(self, articles, extract=None):
+        # Скачивает и разбирает статьи параллельно, отдавая (ссылка, дата, текст) по мере готовности
+        tasks = [asyncio.create_task(self._fetch_article(link, date, extract)) for date, link in articles]
         try:
-            response = session.head(url, timeout=20, allow_redirects=True)
-            if not response.ok or response.status_code >= 400:
-                response = session.get(url, timeout=7, allow_redirects=True, stream=True)
-            response.raise_for_status()
-            print(f"✔️ URL '{url}' существует (статус {response.status_code}).")
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                if result:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self._log_fetch_summary([link for _, link in articles])
+
+    def fetch_summary(self, links=None):
+        # Итог по статьям: сколько скачано, сколько не удалось, сколько всего было попыток
+        # Ссылки без статуса не дождались ответа: потребитель остановил обход раньше
+        stats = [self.fetch_stats.get(link, {}) for link in (links or list(self.fetch_stats))]
+        return {
+            'ok': sum(1 for item in stats if item.get('status') == 'ok'),
+            'failed': sum(1 for item in stats if item.get('status') == 'failed'),
+            'cancelled': sum(1 for item in stats if 'status' not in item),
+            'attempts': sum(item.get('attempts', 0) for item in stats),
+        }
+
+    def _log_fetch_summary(self, links):
+        summary = self.fetch_summary(links)
+        print(f"Статьи: скачано {summary['ok']}, не удалось {summary['failed']}, прервано {summary['cancelled']}, "
+              f"попыток {summary['attempts']}")
+        for link in links:
+            item = self.fetch_stats.get(link, {})
+            if item.get('status') == 'failed':
+                print(f"  не удалось скачать {link}: {item['errors'][-1]}")
+
+    async def _fetch_article(self, link, date, extract=None):
+        host = urlparse(link).netloc
+        limit = self._host_limits.setdefault(host, asyncio.Semaphore(self.host_concurrency))
+        stats = self.fetch_stats.setdefault(link, {'attempts': 0, 'errors': []})
+
+        # Как и раньше, при неудаче пробуем ссылку без завершающего слэша
+        candidates = list(dict.fromkeys([link, link.rstrip('/')]))
+        for attempt in range(self.article_retries + 1):
+            candidate = candidates[min(attempt, len(candidates) - 1)]
+            stats['attempts'] += 1
+            try:
+                async with limit:
+                    session = await self._get_session()
+                    async with session.get(candidate, allow_redirects=True, headers=self._headers()) as response:
+                        response.raise_for_status()
+                        html = await response.text()
+                loop = asyncio.get_running_loop()
+                text = await loop.run_in_executor(_extract_pool, extract or self._extract_text, candidate, html)
+                stats['status'] = 'ok'
+                return candidate, date, text
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats['errors'].append(f"{type(e).__name__}: {e}")
+                print(f"Error parsing article {candidate} (попытка {attempt + 1}): Type={type(e)}, Error={e}")
+                if attempt < self.article_retries:
+                    await asyncio.sleep(0.5 * (attempt + 1))
+        stats['status'] = 'failed'
+        return None
+
+    @staticmethod
+    def _extract_text(url, html):
+        article_obj = Article(url)
+        article_obj.download(input_html=html)
+        article_obj.parse()
+        return article_obj.text
+
+    async def check_url_exists(self, url):
+        # True - страница есть, False - сервер ответил ошибкой, None - сервер недоступен
+        session = await self._get_session()
+        timeout = aiohttp.ClientTimeout(total=float(os.getenv('NEWS_PAGE_PROBE_TIMEOUT', 7)))
+        try:
+            async with session.head(url, allow_redirects=True, headers=self._headers(self.user_agents[0]),
+                                    timeout=timeout) as response:
+                status = response.status
+            if status >= 400:
+                # Часть серверов не поддерживает HEAD - повторяем GET без чтения тела
+                async with session.get(url, allow_redirects=True, headers=self._headers(self.user_agents[0]),
+                                       timeout=timeout) as response:
+                    status = response.status
+            if status >= 400:
+                return False
+            print(f"✔️ URL '{url}' существует (статус {status}).")
             return True
-        except requests.exceptions.RequestException as e:
-            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
         except Exception as e:
             print(f"Неожиданная ошибка при проверке URL '{url}': {e}")
-            return False
+            return None
 
     async def find_news_page_url(self, base_url):
         if not base_url.startswith(('http://', 'https://')):
@@ -140,30 +262,47 @@ class Parser:
             return base_url
 
         normalized_base_url = base_url.rstrip('/')
+        domain = urlparse(normalized_base_url).netloc
+        cached = (_news_pages.get(domain) or _news_pages_missing.get(f"miss:{domain}")) if _news_pages else None
+        if cached:
+            print(f"Новостная страница для {domain} из кэша: {cached}")
+            return cached
 
         print(f"Ищем новостную страницу для: {normalized_base_url}")
 
-        headers = {
-            'User-Agent': self.user_agents[0]
-        }
-        session = requests.Session()
-        session.headers.update(headers)
-
         with open(os.getenv('NEWS_PAGE_VARS'), 'r', encoding='utf-8') as f:
-            newspagevars = f.read().split('\n')
-
-        for var in newspagevars:
-            print(f"\n1. Проверяем наличие /{var}...")
-            news_url = urljoin(normalized_base_url, f'/{var}')
-            if await self.check_url_exists(news_url, session):
-                print(f"Найден URL: {news_url}")
-                return news_url + '/'
+            newspagevars = [var.strip() for var in f.read().split('\n') if var.strip()]
+
+        # Все варианты проверяются параллельно, но ответ выбирается по порядку в файле:
+        # как только подтвердился самый приоритетный из оставшихся, остальные проверки отменяются
+        candidates = [urljoin(normalized_base_url, f'/{var}') for var in newspagevars]
+        tasks = [asyncio.create_task(self.check_url_exists(news_url)) for news_url in candidates]
+        result = None
+        answered = False
+        try:
+            for news_url, task in zip(candidates, tasks):
+                exists = await task
+                answered = answered or exists is not None
+                if exists:
+                    print(f"Найден URL: {news_url}")
+                    result = news_url + '/'
+                    break
             else:
-                print(f"  URL {news_url} не найден или недоступен.")
-
-        print("\n4. Ни один из приоритетных URL не найден или не доступен.")
-        print(f"Возвращаем базовый URL: {normalized_base_url}")
-        return normalized_base_url
+                print("Ни один из приоритетных URL не найден или не доступен.")
+                print(f"Возвращаем базовый URL: {normalized_base_url}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if not _news_pages:
+            return result or normalized_base_url
+        if result:
+            _news_pages.set(domain, result)
+        elif answered:
+            # Сайт отвечал, но вариантов нет - не перебираем их снова в ближайший час
+            _news_pages_missing.set(f"miss:{domain}", normalized_base_url)
+        # Если сайт не ответил ни на одну проверку, сбой мог быть временным - ничего не запоминаем
+        return result or normalized_base_url
 
     async def search_site(self, url):
         session = await self._get_session()
@@ -171,7 +310,7 @@ class Parser:
 
         print(f"\n Поиск в {url}...")
         try:
-            async with session.get(url, allow_redirects=True) as response:
+            async with session.get(url, allow_redirects=True, headers=self._headers()) as response:
                 print(f"  Статус ответа: {response.status}")
                 if not response.ok:
                     print(f"  Ошибка: Сервер вернул статус {response.status}")
@@ -263,15 +402,28 @@ class Parser:
             return None
 
         page = await self.get_soup(url)
-        links = link_finder(page, days)
+        if not page:
+            return []
+
+        links, confidence = extractor.extract(page, url)
+        if confidence >= extractor.threshold:
+            start, end = self.parse_days(days)
+            return [[date.strftime('%d.%m.%Y') if date else '0.0.0000', link.rstrip('/') + '/']
+                    for date, link in links if date is None or start <= date <= end]
+
+        # Эвристика не уверена - спрашиваем LLM, но только по сжатому списку ссылок
+        print(f"Уверенность эвристики {confidence:.2f}, используем LLM")
+        links = await link_finder(extractor.pruned_page(page, url), days)
         print('links are', links)
         lst = []
         for link in links.split(','):
-            lst.append(link.split(';'))
+            parts = link.split(';')
+            if len(parts) == 2 and parts[1].strip():
+                lst.append(parts)
         print('lst is', lst)
         lst = [
-            [d, url + '/'.join(x.strip().strip('/').split('/')[1:]) + '/']
-            if '//' not in x else [d, x.strip().rstrip('/') + '/']
+            [d.strip(), url + '/'.join(x.strip().strip('/').split('/')[1:]) + '/']
+            if '//' not in x else [d.strip(), x.strip().rstrip('/') + '/']
             for d, x in lst
         ]
         return lst
@@ -288,128 +440,15 @@ class Parser:
         # else:
         #    print("Достаю новости из HTML")
 
-    async def odinc(self, soup, rng):
-        print("Parsing ODINC")
-        try:
-            articles = {}
-
-            tbody = soup.select_one(os.getenv('ODINC_LIST'))
-
-            for item in tbody.find_all('tr', class_='pb-1'):
-                time_el = item.find('td', class_='news-date-time').text.strip()
-                link = item.find('a')
-                article_date = datetime.strptime(time_el, '%d.%m.%Y').date()
-                if rng[0] <= article_date <= rng[1]:
-                    base_url = '/'.join(os.getenv('ODINC').split('/')[:-2])
-                    ur = f"{base_url}{link.get('href')}"
-                    page = await self.get_soup(ur)
-
-                    if page:
-                        txt = page.find('main', class_='p-3')
-                        articles[ur] = [time_el, txt.text]
-        except Exception as e:
-            print(f"Error parsing ODINC: {e}")
-            await self.bot.send_message(self.id, f"Ошибка парсинга ODINC: {e}")
-            return None
-        print(articles)
-        return articles
-
-    async def uchet(self, soup, rng):
-        articles = {}
-
-        tbody = soup.select_one(os.getenv('UCHET_LIST'))
-
-        for item in tbody.find_all('div', class_='w-100'):
-            time_el = item.find('small', class_='text-info').text.strip()
-            link = item.find('a')
-            article_date = datetime.strptime(time_el, '%d.%m.%Y').date()
-
-            if rng[0] <= article_date <= rng[1]:
-                base_url = '/'.join(os.getenv('UCHET').split('/')[:-2])
-                ur = f"{base_url}{link.get('href')}"
-                page = await self.get_soup(ur)
-
-                if page:
-                    txt = page.find('article', itemprop='articleBody')
-                    articles[ur] = [time_el, txt.text]
-
-        return articles
-
-    async def mybuh(self, soup, rng):
-        articles = {}
-
-        tbody = soup.select_one("ul.popular-news__list.scroll")
-
-        for item in tbody.find_all('li'):
-            time_el = item.find('time')
-            if not time_el:
-                continue
-
-            time_el = time_el.text.strip().split(', ')[0]
-            link = item.find('a')
-            article_date = datetime.strptime(time_el, '%d.%m.%Y').date()
-
-            if rng[0] <= article_date <= rng[1]:
-                base_url = '/'.join(os.getenv('MYBUH').split('/')[:-2])
-                ur = f"{base_url}{link.get('href')}"
-                page = await self.get_soup(ur)
-
-                if page:
-                    txt = page.find('div', class_='d_text')
-                    articles[ur] = [time_el, txt.text]
-
-        return articles
-
-    async def pro1c(self, soup, rng):
-        articles = {}
-
-        tbody = soup.select_one(os.getenv('PRO1C_LIST'))
-
-        for item in tbody.find_all('li'):
-            time_el = item.find('small', class_='text-muted')
-            if not time_el:
-                continue
-
-            time_el = time_el.text.strip()
-            link = item.find('a')
-            article_date = datetime.strptime(time_el, '%d.%m.%Y').date()
-
-            if rng[0] <= article_date <= rng[1]:
-                base_url = '/'.join(os.getenv('PRO1C').split('/')[:-2])
-                ur = f"{base_url}{link.get('href')}"
-                page = await self.get_soup(ur)
-
-                if page:
-                    txt = page.find('div', itemprop='articleBody')
-                    articles[ur] = [time_el, txt.text]
-
-        return articles
-
-    async def gos24(self, soup, rng):
-        articles = {}
-
-        tbody = soup.select_one(os.getenv('GOS24_LIST'))
-
-        for item in tbody.find_all('div', class_='news-block'):
-            time_el = item.find('div', class_='date').text.strip()
-            link = item.find('a')
-
-            formatted_date = self.dateformat(time_el)
-            article_date = datetime.strptime(formatted_date, '%d.%m.%Y').date()
-
-            if rng[0] <= article_date <= rng[1]:
-                ur = f"{os.getenv('GOS24')[:-1]}{link.get('href')}"
-                page = await self.get_soup(ur)
-
-                if page:
-                    txt = page.find('div', class_='editor')
-                    articles[ur] = [formatted_date, txt.text]
-
-        return articles
-
     async def kgd(self, soup, rng, **nums):
-        res = []
+        codes = set(nums['nums'])
+        return [(form_number, article_date.strftime('%d.%m.%Y'), download_link)
+                for form_number, article_date, download_link in self.kgd_rows(soup)
+                if rng[0] <= article_date <= rng[1] and form_number in codes]
 
+    @staticmethod
+    def kgd_rows(soup):
+        # Строки таблицы форм ФНО: (код формы, дата, ссылка на скачивание)
         tbody = soup.select_one(os.getenv('KGD_LIST'))
 
         for numtr in tbody.find_all('tr'):
@@ -419,33 +458,13 @@ class Parser:
 
             first_td_text = tds[0].get_text(strip=True)
             last_td_link = tds[-1].find('a')
-            time_el = tds[-2].find('span').text.strip()
-            if not any(c.isdigit() for c in time_el):
+            span = tds[-2].find('span')
+            time_el = span.text.strip() if span else ''
+            if not any(c.isdigit() for c in time_el) or not first_td_text or not last_td_link:
                 continue
             article_date = datetime.strptime(time_el, '%d.%m.%Y').date()
 
-            if rng[0] <= article_date <= rng[1] and first_td_text and last_td_link and first_td_text in nums['nums']:
-                form_number = first_td_text
-                download_link = last_td_link.get('href')
-                res.append((form_number, article_date.strftime('%d.%m.%Y'), download_link))
-
-        return res
-
-    @staticmethod
-    def dateformat(date_str):
-        months = {
-            'января': '01', 'февраля': '02', 'марта': '03',
-            'апреля': '04', 'мая': '05', 'июня': '06',
-            'июля': '07', 'августа': '08', 'сентября': '09',
-            'октября': '10', 'ноября': '11', 'декабря': '12',
-            'қаңтар': '01', 'ақпан': '02', 'наурыз': '03',
-            'сәуір': '04', 'мамыр': '05', 'маусым': '06',
-            'шілде': '07', 'тамыз': '08', 'қыркүйек': '09',
-            'қазан': '10', 'қараша': '11', 'желтоқсан': '12'
-        }
-
-        parts = date_str.strip().split()
-        return f"{parts[0]}.{months[parts[1]].lower()}.{parts[2]}"
+            yield first_td_text, article_date, last_td_link.get('href')
 
     @staticmethod
     def parse_days(days):
@@ -1,25 +1,283 @@
+import argparse
+import inspect
+import os
+import threading
+import time
+
+import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+from dotenv import load_dotenv
+
+from news_include.cache import SqliteCache, content_hash
+
+load_dotenv()
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def default_onnx_path(snapshot):
+    return os.getenv('RUBERT_ONNX') or os.path.join(snapshot, 'onnx', 'model.onnx')
 
 
 class RubertClassifier:
+    # backend: 'torch' - исходная модель, 'int8' - динамическая int8-квантизация PyTorch (CPU),
+    # 'onnx' - сессия ONNX Runtime, экспортированная командой `python -m news_include.rubert export`
+
+    def __init__(self, snapshot, backend=None, cache=None):
+        self.snapshot = snapshot
+        self.backend = backend or os.getenv('RUBERT_BACKEND', 'torch')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд RuBERT: {self.backend}. Доступны: {', '.join(BACKENDS)}")
 
-    def __init__(self, snapshot):
         self.tokenizer = AutoTokenizer.from_pretrained(snapshot)
-        self.model = AutoModelForSequenceClassification.from_pretrained(snapshot)
-        if torch.cuda.is_available():
-            self.model.cuda()
+        self.config = AutoConfig.from_pretrained(snapshot)
+        self.model = None
+        self.session = None
+        # Кэш вероятностей по (хэш текста, тема, версия модели)
+        self.cache = cache
+        self.snapshot_id = self._snapshot_id()
+
+        if self.backend == 'onnx':
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.onnx_path = default_onnx_path(snapshot)
+            self.session = ort.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+            self._onnx_inputs = {i.name for i in self.session.get_inputs()}
+        else:
+            self.model = AutoModelForSequenceClassification.from_pretrained(snapshot)
+            self.model.eval()
+            if self.backend == 'int8':
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif torch.cuda.is_available():
+                self.model.cuda()
+
+    def _snapshot_id(self):
+        revision = getattr(self.config, '_commit_hash', None)
+        if not revision:
+            weights = [os.path.join(self.snapshot, name) for name in ('model.safetensors', 'pytorch_model.bin')]
+            revision = next((str(int(os.path.getmtime(w))) for w in weights if os.path.exists(w)), 'local')
+        return f"{os.path.basename(os.path.normpath(self.snapshot))}@{revision}:{self.backend}"
 
     @staticmethod
     def text_preprocess(text):
         text = f"Это статья на тему '{text.strip()}'"
-        return text 
+        return text
 
     def predict(self, text, label_texts, label='entailment', normalize=True):
-        tokens = self.tokenizer([self.text_preprocess(text)] * len(label_texts), label_texts, truncation=True, return_tensors='pt', padding=True)
-        with torch.inference_mode():
-            result = torch.softmax(self.model(**tokens.to(self.model.device)).logits, -1)
-        proba = result[:, self.model.config.label2id[label]].cpu().numpy()
+        proba = self.predict_batch([text], label_texts, label=label)[0]
         if normalize:
             proba /= sum(proba)
-        return proba  
\ No newline at end of file
+        return proba
+
+    def predict_batch(self, texts, label_texts, label='entailment', batch_size=None, max_tokens=None):
+        # Матрица (статьи x темы) с вероятностью entailment для каждой пары
+        batch_size = batch_size or int(os.getenv('RUBERT_BATCH', 32))
+        max_tokens = max_tokens or int(os.getenv('RUBERT_BATCH_TOKENS', 8192))
+        scores = np.zeros((len(texts), len(label_texts)), dtype=np.float32)
+        if not texts or not label_texts:
+            return scores
+
+        premises = [self.text_preprocess(text) for text in texts]
+        pairs = [(i, j) for i in range(len(texts)) for j in range(len(label_texts))]
+
+        keys = {}
+        if self.cache is not None:
+            hashes = [content_hash(premise) for premise in premises]
+            keys = {(i, j): content_hash(hashes[i], label_texts[j], label, self.snapshot_id) for i, j in pairs}
+            cached = self.cache.get_many(keys.values())
+            for pair, key in keys.items():
+                if key in cached:
+                    scores[pair] = cached[key]
+            pairs = [pair for pair in pairs if keys[pair] not in cached]
+            if not pairs:
+                return scores
+
+        premise_len = [len(ids) for ids in self.tokenizer(premises, truncation=True)['input_ids']]
+        label_len = [len(ids) for ids in self.tokenizer(list(label_texts), add_special_tokens=False)['input_ids']]
+
+        # Сортируем пары по длине, чтобы в микро-батче было меньше паддинга
+        pairs.sort(key=lambda p: premise_len[p[0]] + label_len[p[1]])
+
+        batch = []
+        for pair in pairs:
+            length = min(premise_len[pair[0]] + label_len[pair[1]], self.tokenizer.model_max_length)
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * length > max_tokens):
+                self._score_pairs(batch, premises, label_texts, label, scores)
+                batch = []
+            batch.append(pair)
+        if batch:
+            self._score_pairs(batch, premises, label_texts, label, scores)
+
+        if self.cache is not None:
+            self.cache.set_many({keys[pair]: float(scores[pair]) for pair in pairs})
+        return scores
+
+    def _score_pairs(self, batch, premises, label_texts, label, scores):
+        proba = self._entailment([premises[i] for i, _ in batch], [label_texts[j] for _, j in batch], label)
+        for (i, j), p in zip(batch, proba):
+            scores[i, j] = p
+
+    def _entailment(self, premises, hypotheses, label):
+        label_id = self.config.label2id[label]
+        if self.session is not None:
+            tokens = self.tokenizer(premises, hypotheses, truncation=True, return_tensors='np', padding=True)
+            feed = {name: value.astype(np.int64) for name, value in tokens.items() if name in self._onnx_inputs}
+            logits = self.session.run(['logits'], feed)[0]
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            result = np.exp(logits)
+            return (result / result.sum(axis=-1, keepdims=True))[:, label_id]
+
+        tokens = self.tokenizer(premises, hypotheses, truncation=True, return_tensors='pt', padding=True)
+        with torch.inference_mode():
+            result = torch.softmax(self.model(**tokens.to(self.model.device)).logits, -1)
+        return result[:, label_id].cpu().numpy()
+
+    def memory_bytes(self):
+        if self.session is not None:
+            return os.path.getsize(self.onnx_path)
+        # state_dict учитывает и упакованные int8-веса, которых нет в parameters();
+        # размер считаем по тензорам, не сериализуя копию весов
+        return sum(_tensor_bytes(value) for value in self.model.state_dict().values())
+
+
+def _tensor_bytes(value):
+    # Упакованные параметры квантизованных слоёв лежат в state_dict кортежами (веса, смещения)
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    if isinstance(value, torch.Tensor):
+        return value.nelement() * value.element_size()
+    return 0
+
+
+_score_cache = None
+
+
+def score_cache():
+    global _score_cache
+    path = os.getenv('SCORE_CACHE', 'cache/scores.sqlite')
+    if _score_cache is None and path:
+        _score_cache = SqliteCache(path, max_entries=int(os.getenv('SCORE_CACHE_SIZE', 200000)))
+    return _score_cache
+
+
+# Реестр загруженных моделей: одна копия весов на процесс для всех пользователей
+_classifiers = {}
+_metrics = {}
+_lock = threading.Lock()
+
+
+def get_classifier(snapshot, backend=None):
+    key = (snapshot, backend or os.getenv('RUBERT_BACKEND', 'torch'))
+    classifier = _classifiers.get(key)
+    if classifier is not None:
+        return classifier
+
+    with _lock:
+        classifier = _classifiers.get(key)
+        if classifier is None:
+            started = time.perf_counter()
+            classifier = RubertClassifier(snapshot, backend=key[1], cache=score_cache())
+            load_seconds = time.perf_counter() - started
+            _classifiers[key] = classifier
+            _metrics[key] = {
+                'load_seconds': round(load_seconds, 3),
+                'memory_bytes': classifier.memory_bytes(),
+                'loaded_at': time.time(),
+            }
+            print(f"RuBERT '{snapshot}' ({key[1]}) загружен за {load_seconds:.2f} c, "
+                  f"{_metrics[key]['memory_bytes'] / 2 ** 20:.1f} МБ")
+    return classifier
+
+
+def classifier_metrics():
+    metrics = {f"{snapshot}:{backend}": dict(metrics) for (snapshot, backend), metrics in _metrics.items()}
+    if _score_cache is not None:
+        metrics['score_cache'] = _score_cache.stats()
+    return metrics
+
+
+def export_onnx(snapshot, out_path, quantize=True):
+    # Экспорт в ONNX с динамическими осями батча и длины; при quantize веса дополнительно
+    # квантизуются в int8 средствами ONNX Runtime
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tokenizer = AutoTokenizer.from_pretrained(snapshot)
+    model = AutoModelForSequenceClassification.from_pretrained(snapshot)
+    model.eval()
+
+    sample = tokenizer([RubertClassifier.text_preprocess("пример")], ["тема"], return_tensors='pt')
+    # Входы передаются позиционно в порядке forward(), а не токенизатора: у BERT порядки расходятся
+    # (attention_mask и token_type_ids), и имена иначе достались бы чужим входам графа
+    names = [name for name in inspect.signature(model.forward).parameters if name in sample]
+    axes = {name: {0: 'batch', 1: 'sequence'} for name in names}
+    axes['logits'] = {0: 'batch'}
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    raw_path = out_path + '.fp32' if quantize else out_path
+    args = tuple(sample[name] for name in names)
+    torch.onnx.export(model, args, raw_path, input_names=names, output_names=['logits'],
+                      dynamic_axes=axes, opset_version=17)
+    if quantize:
+        quantize_dynamic(raw_path, out_path, weight_type=QuantType.QInt8)
+        os.remove(raw_path)
+    print(f"Модель экспортирована в {out_path} ({os.path.getsize(out_path) / 2 ** 20:.1f} МБ)")
+
+
+def parity_check(snapshot, backend, texts, labels):
+    # Сравнивает вероятности бэкенда с исходной моделью PyTorch на одних и тех же парах
+    reference = RubertClassifier(snapshot, backend='torch')
+    candidate = RubertClassifier(snapshot, backend=backend)
+
+    started = time.perf_counter()
+    expected = reference.predict_batch(texts, labels)
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = candidate.predict_batch(texts, labels)
+    candidate_seconds = time.perf_counter() - started
+
+    threshold = float(os.getenv('INTENSE', 0.8))
+    report = {
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+        'mean_abs_diff': float(np.abs(expected - actual).mean()),
+        'threshold_agreement': float(((expected > threshold) == (actual > threshold)).mean()),
+        'speedup': reference_seconds / max(candidate_seconds, 1e-9),
+        'memory_ratio': candidate.memory_bytes() / reference.memory_bytes(),
+    }
+    return report
+
+
+def _read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    cli = argparse.ArgumentParser(description="Экспорт и проверка бэкендов RuBERT")
+    commands = cli.add_subparsers(dest='command', required=True)
+
+    export_cmd = commands.add_parser('export', help="Экспортировать модель в ONNX")
+    export_cmd.add_argument('--snapshot', default=os.getenv('RUBERT'))
+    export_cmd.add_argument('--out', default=None)
+    export_cmd.add_argument('--no-quantize', action='store_true')
+
+    parity_cmd = commands.add_parser('parity', help="Сравнить бэкенд с исходной моделью")
+    parity_cmd.add_argument('--snapshot', default=os.getenv('RUBERT'))
+    parity_cmd.add_argument('--backend', choices=BACKENDS[1:], default='onnx')
+    parity_cmd.add_argument('--texts', required=True, help="Файл с текстами статей, по одной на строку")
+    parity_cmd.add_argument('--labels', default=os.getenv('THEMES'), help="Файл с темами, по одной на строку")
+    parity_cmd.add_argument('--tolerance', type=float, default=0.05)
+
+    args = cli.parse_args()
+    if args.command == 'export':
+        export_onnx(args.snapshot, args.out or default_onnx_path(args.snapshot), quantize=not args.no_quantize)
+    else:
+        result = parity_check(args.snapshot, args.backend, _read_lines(args.texts), _read_lines(args.labels))
+        for name, value in result.items():
+            print(f"{name}: {value:.4f}")
+        if result['max_abs_diff'] > args.tolerance:
+            raise SystemExit(f"Расхождение {result['max_abs_diff']:.4f} превышает допуск {args.tolerance}")
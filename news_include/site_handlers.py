@@ -0,0 +1,108 @@
+import json
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urljoin
+
+import soupsieve as sv
+from bs4 import BeautifulSoup as bs
+from dotenv import load_dotenv
+
+from news_include.link_extractor import MONTHS, find_date
+
+load_dotenv()
+
+MONTH_NAME = re.compile('|'.join(MONTHS), re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def compiled(selector):
+    # Селекторы разбираются soupsieve один раз на процесс, а не при каждом select()
+    return sv.compile(selector)
+
+
+def parse_date(text, date_format):
+    text = text.strip()
+    numeric = text
+    if '%B' in date_format:
+        # strptime зависит от локали, поэтому русские и казахские месяцы переводим в номера сами
+        numeric = MONTH_NAME.sub(lambda m: MONTHS[m[0].lower()], text)
+        date_format = date_format.replace('%B', '%m')
+    try:
+        return datetime.strptime(numeric, date_format).date()
+    except ValueError:
+        # Лишний хвост вроде ", 12:30" - ищем дату в исходном тексте общими шаблонами,
+        # они сами понимают названия месяцев
+        return find_date(text)
+
+
+class SiteSpec:
+    # Описание сайта из news_sites.jsonl: контейнер списка, элементы, дата и тело статьи.
+    # URL и селектор списка можно переопределить переменными окружения <SITE> и <SITE>_LIST.
+
+    def __init__(self, spec):
+        self.id = spec['id']
+        self.site = spec['site']
+        self.url = os.getenv(self.site) or spec['url']
+        self.list = os.getenv(f"{self.site}_LIST") or spec['list']
+        self.item = spec['item']
+        self.date = spec['date']
+        self.date_format = spec.get('date_format', '%d.%m.%Y')
+        self.link = spec.get('link', 'a')
+        self.body = spec['body']
+
+    def articles(self, soup, rng):
+        # [[дата 'дд.мм.гггг', ссылка]] за период - в том же виде, что и Parser.get_article_list
+        container = compiled(self.list).select_one(soup)
+        if container is None:
+            raise ValueError(f"контейнер новостей {self.list!r} не найден")
+
+        articles = []
+        for item in compiled(self.item).select(container):
+            date_el = compiled(self.date).select_one(item)
+            link = compiled(self.link).select_one(item)
+            if date_el is None or link is None or not link.get('href'):
+                continue
+            date_text = date_el.get_text(' ', strip=True)
+            article_date = parse_date(date_text, self.date_format)
+            if article_date is None:
+                print(f"{self.site}: не удалось разобрать дату {date_text!r}, пропускаем {link['href']}")
+                continue
+            if rng[0] <= article_date <= rng[1]:
+                articles.append([article_date.strftime('%d.%m.%Y'), urljoin(self.url, link['href'].strip())])
+        return articles
+
+    def extract_text(self, url, html):
+        body = compiled(self.body).select_one(bs(html, 'lxml'))
+        return body.get_text() if body is not None else None
+
+
+class SiteRegistry:
+
+    def __init__(self, path):
+        self.path = path
+        self._sites = None
+
+    def _load(self):
+        sites = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    spec = json.loads(line)
+                    # KGD публикует формы ФНО, а не статьи - у него свой индекс
+                    if spec.get('type', 'news') != 'news':
+                        continue
+                    site = SiteSpec(spec)
+                    sites[site.url.rstrip('/')] = site
+        return sites
+
+    def get(self, url):
+        if self._sites is None:
+            self._sites = self._load()
+        return self._sites.get(url.rstrip('/'))
+
+
+sites = SiteRegistry(os.getenv('NEWS_SITES', 'static/news_sites.jsonl'))
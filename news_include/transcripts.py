@@ -0,0 +1,104 @@
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Transcript:
+    # Транскрипт в колоночном виде: секунды начала фрагментов и единый UTF-8 буфер текста со смещениями
+
+    def __init__(self, video_id, language, starts, offsets, text):
+        self.video_id = video_id
+        self.language = language
+        self.starts = starts
+        self.offsets = offsets
+        self.text = text
+
+    @classmethod
+    def from_snippets(cls, video_id, language, snippets):
+        encoded = [snippet.text.replace('\n', ' ').encode('utf-8') for snippet in snippets]
+        lengths = np.fromiter((len(chunk) for chunk in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        starts = np.fromiter((snippet.start for snippet in snippets), dtype=np.float64, count=len(encoded))
+        text = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(video_id, language, starts, offsets, text)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def render(self, first=0, last=None):
+        # Формат "t=секунды текст\n" собирается целиком в numpy, без Python-строки на каждый фрагмент
+        last = len(self) if last is None else last
+        count = last - first
+        if count <= 0:
+            return ''
+
+        prefixes = np.char.mod('t=%d ', self.starts[first:last].astype(np.int64)).astype(np.bytes_)
+        prefix_len = np.char.str_len(prefixes).astype(np.int64)
+        prefix_bytes = prefixes.view(np.uint8).reshape(count, -1)
+        prefix_bytes = prefix_bytes[np.arange(prefix_bytes.shape[1]) < prefix_len[:, None]]
+
+        text_start = self.offsets[first:last]
+        text_len = self.offsets[first + 1:last + 1] - text_start
+
+        line_len = prefix_len + text_len + 1
+        line_start = np.zeros(count, dtype=np.int64)
+        np.cumsum(line_len[:-1], out=line_start[1:])
+        out = np.empty(int(line_len.sum()), dtype=np.uint8)
+
+        out[self._spread(line_start, prefix_len)] = prefix_bytes
+        text_index = self._spread(text_start, text_len)
+        out[self._spread(line_start + prefix_len, text_len)] = self.text[text_index]
+        out[line_start + prefix_len + text_len] = ord('\n')
+        return out.tobytes().decode('utf-8')
+
+    @staticmethod
+    def _spread(starts, lengths):
+        # Индексы starts[i] .. starts[i] + lengths[i] - 1 для всех i подряд
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        group_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.repeat(starts, lengths) + (np.arange(total, dtype=np.int64) - group_start)
+
+
+class TranscriptStore:
+    # Транскрипты на диске по (video_id, язык) в сжатом .npz
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._memory = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, video_id, language):
+        return os.path.join(self.directory, f"{video_id}.{language}.npz")
+
+    def get(self, video_id, languages):
+        for language in languages:
+            key = (video_id, language)
+            if key in self._memory:
+                return self._memory[key]
+            path = self._path(video_id, language)
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    transcript = Transcript(video_id, language, data['starts'], data['offsets'], data['text'])
+                with self._lock:
+                    self._memory[key] = transcript
+                return transcript
+        return None
+
+    def put(self, transcript):
+        path = self._path(transcript.video_id, transcript.language)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, starts=transcript.starts, offsets=transcript.offsets, text=transcript.text)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._memory[(transcript.video_id, transcript.language)] = transcript
+
+
+store = TranscriptStore(os.getenv('TRANSCRIPT_STORE', 'cache/transcripts'))
@@ -1,13 +1,39 @@
 from youtube_transcript_api import YouTubeTranscriptApi
 from re import match, sub
+import asyncio
 import os
 from dotenv import load_dotenv
 
+from news_include.transcripts import Transcript, store as transcript_store
+
 load_dotenv()
 
+LANGUAGES = ['ru', 'kz', 'en']
+
+# Кодировщик tiktoken ищется один раз на процесс; False - недоступен, считаем токены приближённо
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            # Словарь BPE скачивается при первом обращении - без сети здесь будет ошибка ввода-вывода
+            _encoder = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            print(f"tiktoken недоступен ({type(e).__name__}: {e}), токены считаются по длине текста")
+            _encoder = False
+    return _encoder
+
 
 class VideoParser:
 
+    def __init__(self, use_store=True):
+        # use_store: транскрипты берутся из TranscriptStore и отдаются прямо из его массивов
+        self.use_store = use_store
+        self._pending = {}
+
     @staticmethod
     def getytid(text):
         m = match(r'^https?://(?:www\.)?youtube\.com/watch\?v=([^\s&]+)', text)
@@ -21,21 +47,77 @@ class VideoParser:
         try:
             transcript_list = api.fetch(video_id, languages=['ru', 'kz', 'en'])
 
-            formatted_transcript = ""
+            return ''.join(f"t={int(snippet.start)} {snippet.text}\n" for snippet in transcript_list)
 
-            for snippet in transcript_list:
+        except Exception as e:
+            print(f"Не удалось получить транскрипт для video_id '{video_id}': {e}")
+            return None
 
-                start_seconds_float = snippet.start
+    @staticmethod
+    def fetch(video_id):
+        api = YouTubeTranscriptApi()
+        fetched = api.fetch(video_id, languages=LANGUAGES)
+        return Transcript.from_snippets(video_id, fetched.language_code, fetched.snippets)
 
-                timestamp = int(start_seconds_float)
+    async def load(self, video_id):
+        if not self.use_store:
+            return await asyncio.to_thread(self.parse, video_id)
 
-                formatted_transcript += f"t={timestamp} {snippet.text}\n"
+        transcript = transcript_store.get(video_id, LANGUAGES)
+        if transcript is None:
+            try:
+                transcript = await self._start(video_id)
+            except Exception as e:
+                print(f"Не удалось получить транскрипт для video_id '{video_id}': {e}")
+                return None
+        return transcript.render()
 
-            return formatted_transcript
+    def _start(self, video_id):
+        # Одновременные запросы одного видео ждут одну загрузку
+        task = self._pending.get(video_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(video_id))
+            self._pending[video_id] = task
+            task.add_done_callback(lambda t: (self._pending.pop(video_id, None), t.cancelled() or t.exception()))
+        return task
 
-        except Exception as e:
-            print(f"Не удалось получить транскрипт для video_id '{video_id}': {e}")
-            return None
+    async def _fetch_and_store(self, video_id):
+        transcript = await asyncio.to_thread(self.fetch, video_id)
+        await asyncio.to_thread(transcript_store.put, transcript)
+        return transcript
+
+    def prefetch(self, video_id):
+        # Начать загрузку транскрипта заранее, пока бот отвечает пользователю
+        if self.use_store and transcript_store.get(video_id, LANGUAGES) is None:
+            self._start(video_id)
+
+    @staticmethod
+    def count_tokens(text):
+        encoder = _get_encoder()
+        if encoder:
+            try:
+                return len(encoder.encode(text))
+            except Exception:
+                pass
+        return len(text) // 4 + 1
+
+    @staticmethod
+    def split_windows(transcript, budget=None):
+        # Делит транскрипт на окна не больше budget токенов, разрезая только по строкам "t=... текст"
+        budget = budget or int(os.getenv('TRANSCRIPT_WINDOW_TOKENS', 3000))
+        windows, current, size = [], [], 0
+        for line in (transcript or "").splitlines():
+            if not line.strip():
+                continue
+            tokens = VideoParser.count_tokens(line) + 1
+            if current and size + tokens > budget:
+                windows.append('\n'.join(current))
+                current, size = [], 0
+            current.append(line)
+            size += tokens
+        if current:
+            windows.append('\n'.join(current))
+        return windows
 
     @staticmethod
     def postprocess(text, url):
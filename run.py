@@ -8,6 +8,11 @@ from aiogram.fsm.context import FSMContext
 from dotenv import load_dotenv
 
 from modes import assistant, faq, newsmanager, doctor, assistant_2, audio_to_text
+from news_include.inference import executor as inference
+from news_include import http
+from news_include.llm import client as llm
+from news_include.crawler import crawler
+from news_include.kgd_index import kgd_index
 
 load_dotenv()
 
@@ -108,8 +113,25 @@ async def handle_message(message: types.Message, state: FSMContext):
 
 async def main():
     await assistant.initialize_assistant()
+    await faq.reload_faq_data()
+    http.get_session()
+    try:
+        await newsmanager.warmup()
+    except Exception as e:
+        # Без RuBERT недоступен только режим новостей; модель попробуем загрузить при первом запросе
+        print(f"Не удалось прогреть RuBERT: {type(e).__name__} {e}")
+    if int(os.getenv('CRAWL_INTERVAL', 1800)) > 0:
+        crawler.start()
+    kgd_index.start()
     print("Бот запущен...")
-    await dp.start_polling(bot, skip_updates=True)
+    try:
+        await dp.start_polling(bot, skip_updates=True)
+    finally:
+        await crawler.stop()
+        await kgd_index.stop()
+        await http.close_session()
+        await llm.close()
+        inference.shutdown()
 
 
 if __name__ == "__main__":